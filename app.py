@@ -15,19 +15,52 @@ from functools import wraps
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
 
 from db import db
+from db_config import (
+    configure_engine,
+    engine_options,
+    load_database_config,
+    pool_stats,
+)
+from json_provider import json_provider_class
 
 from resources import AuthBlueprint
 from resources import UserBlueprint
 from resources import DataBlueprint
 
-from models import TokenBlocklist, AdminModel
+from commands import (
+    DataCommands,
+    GatewayCommands,
+    PartitionCommands,
+    RetentionCommands,
+    RollupCommands,
+    SummaryCommands,
+)
+
+from models import AdminModel
+
+from services import (
+    data_type_cache,
+    device_status_cache,
+    ingest_queue,
+    metrics,
+    partition_maintenance,
+    password_cache,
+    password_hasher,
+    response_compression,
+    retention_job,
+    token_blocklist,
+)
 
 
 def create_app():
     app = Flask(__name__)
     load_dotenv()  # load contents from .env
 
-    CORS(app, origins="http://localhost:4200")  # CORS policy
+    CORS(
+        app,
+        origins="http://localhost:4200",
+        expose_headers=["ETag", "X-Next-Cursor"],
+    )  # CORS policy
 
     app.config["API_TITLE"] = "IoT REST API"
     app.config["API_VERSION"] = "v1"
@@ -38,14 +71,91 @@ def create_app():
         "https://cdn.jsdelivr.net/npm/swagger-ui-dist/"
     )
 
+    # the standard library unless orjson is asked for, its output differs
+    app.config["JSON_PROVIDER"] = os.getenv("JSON_PROVIDER", "json")
+    app.json = json_provider_class(app.config["JSON_PROVIDER"])(app)
+
+    # gzip/deflate responses of the listed types, the largest request body
+    # read, and the largest body a compressed ingest request may expand to
+    app.config["COMPRESSION_ENABLED"] = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+    app.config["COMPRESSION_MIN_SIZE"] = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+    app.config["COMPRESSION_LEVEL"] = int(os.getenv("COMPRESSION_LEVEL", 6))
+    app.config["COMPRESSION_MIMETYPES"] = os.getenv(
+        "COMPRESSION_MIMETYPES", "application/json,application/x-ndjson,text/csv"
+    ).split(",")
+    app.config["MAX_CONTENT_LENGTH"] = int(
+        os.getenv("MAX_CONTENT_LENGTH", 10 * 1024 * 1024)
+    )
+    app.config["REQUEST_MAX_DECOMPRESSED_SIZE"] = int(
+        os.getenv("REQUEST_MAX_DECOMPRESSED_SIZE", 10 * 1024 * 1024)
+    )
+    response_compression.init_app(app)
+
     # database configuration
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv(
         "DATABASE_URL", "sqlite:///data.db"
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.update(load_database_config())
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"], app.config
+    )
     app.config["PROPAGATE_EXCEPTIONS"] = True
 
+    # data ingestion configuration
+    app.config["DATA_BATCH_MAX_SIZE"] = int(os.getenv("DATA_BATCH_MAX_SIZE", 1000))
+    app.config["DATA_TYPE_CACHE_SIZE"] = int(os.getenv("DATA_TYPE_CACHE_SIZE", 1024))
+    app.config["DATA_ROLLUPS_ENABLED"] = os.getenv("DATA_ROLLUPS_ENABLED", "1") == "1"
+    # latest reading per device and data type and per device counters
+    app.config["DATA_SUMMARIES_ENABLED"] = (
+        os.getenv("DATA_SUMMARIES_ENABLED", "0") == "1"
+    )
+    # hand-written validation of the ingest bodies instead of marshmallow
+    app.config["DATA_LEAN_VALIDATION"] = os.getenv("DATA_LEAN_VALIDATION", "0") == "1"
+    # "sync" commits every request, "write_behind" buffers readings in memory
+    app.config["INGEST_MODE"] = os.getenv("INGEST_MODE", "sync")
+    if app.config["INGEST_MODE"] not in ("sync", "write_behind"):
+        raise ValueError("INGEST_MODE must be either 'sync' or 'write_behind'.")
+    app.config["INGEST_QUEUE_SIZE"] = int(os.getenv("INGEST_QUEUE_SIZE", 10000))
+    app.config["INGEST_FLUSH_ROWS"] = int(os.getenv("INGEST_FLUSH_ROWS", 500))
+    app.config["INGEST_FLUSH_INTERVAL_MS"] = int(
+        os.getenv("INGEST_FLUSH_INTERVAL_MS", 200)
+    )
+    app.config["DEVICE_STATUS_CACHE_TTL"] = float(
+        os.getenv("DEVICE_STATUS_CACHE_TTL", 30)
+    )
+    app.config["DEVICE_STATUS_CACHE_POLL_INTERVAL"] = float(
+        os.getenv("DEVICE_STATUS_CACHE_POLL_INTERVAL", 1)
+    )
+
+    # partitions of the data table are created this many months ahead,
+    # checked every interval seconds on a partitioned PostgreSQL table
+    app.config["DATA_PARTITION_MONTHS_AHEAD"] = int(
+        os.getenv("DATA_PARTITION_MONTHS_AHEAD", 3)
+    )
+    app.config["DATA_PARTITION_MAINTENANCE_INTERVAL"] = float(
+        os.getenv("DATA_PARTITION_MAINTENANCE_INTERVAL", 3600)
+    )
+
+    # readings older than the retention of their data type are deleted every
+    # interval seconds in chunks with a pause between them, 0 disables it
+    app.config["DATA_RETENTION_INTERVAL"] = float(
+        os.getenv("DATA_RETENTION_INTERVAL", 3600)
+    )
+    app.config["DATA_RETENTION_CHUNK_SIZE"] = int(
+        os.getenv("DATA_RETENTION_CHUNK_SIZE", 1000)
+    )
+    app.config["DATA_RETENTION_PAUSE_MS"] = int(
+        os.getenv("DATA_RETENTION_PAUSE_MS", 50)
+    )
+
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
+    data_type_cache.init_app(app)
+    device_status_cache.init_app(app)
+    ingest_queue.init_app(app)
+    partition_maintenance.init_app(app)
 
     api = Api(app)
     migrate = Migrate(app, db)
@@ -53,7 +163,62 @@ def create_app():
     # jwt configuration
     app.config["JWT_SECRET_KEY"] = os.getenv("JWT_KEY")
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=365)
+    app.config["TOKEN_BLOCKLIST_REFRESH_INTERVAL"] = float(
+        os.getenv("TOKEN_BLOCKLIST_REFRESH_INTERVAL", 5)
+    )
+    app.config["TOKEN_BLOCKLIST_RELOAD_INTERVAL"] = float(
+        os.getenv("TOKEN_BLOCKLIST_RELOAD_INTERVAL", 3600)
+    )
+    # successful device logins are cached, 0 disables the cache
+    app.config["PASSWORD_CACHE_SIZE"] = int(os.getenv("PASSWORD_CACHE_SIZE", 10000))
+    app.config["PASSWORD_CACHE_TTL"] = float(os.getenv("PASSWORD_CACHE_TTL", 300))
+    # pbkdf2 runs inline unless a process pool per server process is set up
+    app.config["HASHING_POOL_WORKERS"] = int(os.getenv("HASHING_POOL_WORKERS", 0))
+    app.config["HASHING_MAX_CONCURRENCY"] = int(
+        os.getenv(
+            "HASHING_MAX_CONCURRENCY", 2 * app.config["HASHING_POOL_WORKERS"] or 1
+        )
+    )
+    # the optional TCP line protocol gateway, run with `flask gateway run`
+    app.config["GATEWAY_HOST"] = os.getenv("GATEWAY_HOST", "0.0.0.0")
+    app.config["GATEWAY_PORT"] = int(os.getenv("GATEWAY_PORT", 7070))
+    app.config["GATEWAY_AUTH_TIMEOUT"] = float(os.getenv("GATEWAY_AUTH_TIMEOUT", 10))
+    app.config["GATEWAY_IDLE_TIMEOUT"] = float(os.getenv("GATEWAY_IDLE_TIMEOUT", 0))
+    app.config["GATEWAY_STATUS_INTERVAL"] = float(
+        os.getenv("GATEWAY_STATUS_INTERVAL", 5)
+    )
+    app.config["GATEWAY_WORKERS"] = int(os.getenv("GATEWAY_WORKERS", 4))
+    app.config["GATEWAY_SUBMIT_TIMEOUT"] = float(
+        os.getenv("GATEWAY_SUBMIT_TIMEOUT", 10)
+    )
     jwt = JWTManager(app)
+    password_hasher.init_app(app)
+    password_cache.init_app(app)
+    token_blocklist.init_app(app)
+    retention_job.init_app(app)
+
+    # request timing and the /metrics endpoint, off unless enabled; a share
+    # of the requests can additionally be profiled into PROFILE_DIR
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "0") == "1"
+    app.config["PROFILE_SAMPLE_RATE"] = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    app.config["PROFILE_DIR"] = os.getenv("PROFILE_DIR", "profiles")
+    # /metrics needs an admin token unless requested from one of these
+    app.config["METRICS_ALLOWED_ADDRESSES"] = [
+        address
+        for address in os.getenv("METRICS_ALLOWED_ADDRESSES", "").split(",")
+        if address.strip()
+    ]
+    metrics.init_app(app)
+    metrics.register("db_pool", pool_stats.stats)
+    metrics.register("data_type_cache", data_type_cache.stats)
+    metrics.register("device_status_cache", device_status_cache.stats)
+    metrics.register("token_blocklist", token_blocklist.stats)
+    metrics.register("ingest_queue", ingest_queue.stats)
+    metrics.register("password_hasher", password_hasher.stats)
+    metrics.register("password_cache", password_cache.stats)
+    metrics.register("response_compression", response_compression.stats)
+    metrics.register("partition_maintenance", partition_maintenance.stats)
+    metrics.register("retention", retention_job.stats)
 
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -85,9 +250,7 @@ def create_app():
 
     @jwt.token_in_blocklist_loader
     def check_if_token_in_blocklist(jwt_header, jwt_payload):
-        jti = jwt_payload["jti"]
-        token = TokenBlocklist.query.filter_by(jti=jti).first()
-        return token is not None
+        return token_blocklist.is_revoked(jwt_payload["jti"])
 
     @jwt.revoked_token_loader
     def revoked_token_callback(jwt_header, jwt_payload):
@@ -141,4 +304,11 @@ def create_app():
     api.register_blueprint(UserBlueprint)
     api.register_blueprint(DataBlueprint)
 
+    app.cli.add_command(RollupCommands)
+    app.cli.add_command(DataCommands)
+    app.cli.add_command(PartitionCommands)
+    app.cli.add_command(RetentionCommands)
+    app.cli.add_command(SummaryCommands)
+    app.cli.add_command(GatewayCommands)
+
     return app
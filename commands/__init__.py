@@ -0,0 +1,6 @@
+from commands.rollup import cli as RollupCommands
+from commands.partitions import cli as PartitionCommands
+from commands.retention import cli as RetentionCommands
+from commands.data import cli as DataCommands
+from commands.summary import cli as SummaryCommands
+from commands.gateway import cli as GatewayCommands
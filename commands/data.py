@@ -0,0 +1,69 @@
+import time
+
+import click
+from flask.cli import AppGroup
+
+from services.bulk_import import ReadingImporter, create_indexes, drop_indexes
+
+cli = AppGroup("data", help="Bulk operations on the readings.")
+
+
+@cli.command("import")
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--device-id", type=int, help="Device of the records without a device_id."
+)
+@click.option(
+    "--format",
+    type=click.Choice(["csv", "ndjson"]),
+    help="Format of the files, by default taken from their extension.",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=50000,
+    show_default=True,
+    help="Readings written per transaction.",
+)
+@click.option(
+    "--drop-indexes",
+    "rebuild_indexes",
+    is_flag=True,
+    help="Drop the data table indexes during the load and rebuild them after.",
+)
+@click.option("--skip-invalid", is_flag=True, help="Skip records that cannot be read.")
+def import_command(files, device_id, format, chunk_size, rebuild_indexes, skip_invalid):
+    """Import readings from CSV or NDJSON files (also gzip compressed).
+
+    Each record has a time, a value and either a data_type_id or a name and
+    unit, plus a device_id unless --device-id is given; files written by the
+    export endpoint can be imported as they are.
+    """
+    importer = ReadingImporter(device_id, chunk_size, skip_invalid)
+    indexes = drop_indexes() if rebuild_indexes else []
+
+    started = time.perf_counter()
+    try:
+        for path in files:
+            importer.import_file(path, format)
+            elapsed = time.perf_counter() - started
+            click.echo(
+                f"{path}: {importer.imported} readings imported, "
+                f"{importer.imported / elapsed:,.0f} rows/sec."
+            )
+    except ValueError as error:
+        raise click.ClickException(
+            f"{error} {importer.imported} readings were imported before."
+        )
+    finally:
+        if indexes:
+            click.echo("Rebuilding the indexes...")
+            create_indexes(indexes)
+
+    elapsed = time.perf_counter() - started
+    if importer.skipped:
+        click.echo(f"Skipped {importer.skipped} invalid records.")
+    click.echo(
+        f"Imported {importer.imported} readings in {elapsed:.1f}s "
+        f"({importer.imported / elapsed:,.0f} rows/sec)."
+    )
@@ -0,0 +1,24 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from services.gateway import Gateway
+
+cli = AppGroup("gateway", help="Line protocol ingest gateway for devices.")
+
+
+@cli.command("run")
+@click.option("--host", help="Address to listen on, GATEWAY_HOST by default.")
+@click.option("--port", type=int, help="Port to listen on, GATEWAY_PORT by default.")
+def run_command(host, port):
+    """Accept readings over persistent TCP connections until stopped."""
+    app = current_app._get_current_object()
+    try:
+        gateway = Gateway(app)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    gateway.run(host or app.config["GATEWAY_HOST"], port or app.config["GATEWAY_PORT"])
+    click.echo(
+        "Gateway stopped after {readings} readings, {rejected} rejected lines and "
+        "{peak_connections} concurrent connections at most.".format(**gateway.stats())
+    )
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from services.partitions import archive_partitions, create_partitions, list_partitions
+from services.retention import drop_expired_partitions
+
+cli = AppGroup("partitions", help="Maintenance of the monthly data partitions.")
+
+month_type = click.DateTime(formats=["%Y-%m"])
+
+
+@cli.command("list")
+def list_command():
+    """List the monthly partitions (archive tables on SQLite)."""
+    for month, name in list_partitions():
+        click.echo(f"{month:%Y-%m} {name}")
+
+
+@cli.command("create")
+@click.option(
+    "--months-ahead",
+    type=click.IntRange(min=0),
+    help="Months after the current one to create partitions for.",
+)
+def create_command(months_ahead):
+    """Create the missing PostgreSQL partitions up to a few months ahead."""
+    if months_ahead is None:
+        months_ahead = current_app.config["DATA_PARTITION_MONTHS_AHEAD"]
+    created = create_partitions(months_ahead)
+    click.echo(f"Created {len(created)} partitions.")
+
+
+@cli.command("drop")
+@click.option(
+    "--before", type=month_type, required=True, help="First month to keep (YYYY-MM)."
+)
+def drop_command(before):
+    """Drop the partitions of the months before the given one."""
+    for name in drop_expired_partitions(before):
+        click.echo(f"Dropped {name}.")
+
+
+@cli.command("archive")
+@click.option(
+    "--before",
+    type=month_type,
+    default=lambda: datetime.utcnow().strftime("%Y-%m"),
+    help="First month to keep in the data table (YYYY-MM).",
+)
+def archive_command(before):
+    """Move the readings of past months into monthly tables (SQLite only)."""
+    try:
+        moved = archive_partitions(before)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    for name, count in moved.items():
+        click.echo(f"Moved {count} readings into {name}.")
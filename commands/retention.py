@@ -0,0 +1,42 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from db import db
+from models import DataType
+from services.retention import retention_job
+
+cli = AppGroup("retention", help="Retention of the readings per data type.")
+
+
+@cli.command("list")
+def list_command():
+    """List the data types and their retention in days."""
+    for data_type in db.session.execute(
+        select(DataType).order_by(DataType.id)
+    ).scalars():
+        retention = data_type.retention_days or "forever"
+        click.echo(f"{data_type.id} {data_type.name} ({data_type.unit}): {retention}")
+
+
+@cli.command("set")
+@click.argument("data_type_id", type=int)
+@click.argument("days", type=click.IntRange(min=1), required=False)
+def set_command(data_type_id, days):
+    """Keep readings of a data type for DAYS days, or forever without DAYS."""
+    data_type = db.session.get(DataType, data_type_id)
+    if data_type is None:
+        raise click.ClickException("Data type not found.")
+    data_type.retention_days = days
+    db.session.commit()
+
+
+@cli.command("run")
+def run_command():
+    """Prune expired readings and blocklisted tokens once."""
+    report = retention_job.run()
+    click.echo(
+        f"Pruned {report['pruned']} readings, dropped {report['dropped']} "
+        f"partitions and purged {report['tokens']} tokens "
+        f"in {report['seconds']}s."
+    )
@@ -0,0 +1,14 @@
+import click
+from flask.cli import AppGroup
+
+from services.rollups import rebuild_rollups
+
+cli = AppGroup("rollup", help="Maintenance of the pre-aggregated data rollups.")
+
+
+@cli.command("backfill")
+@click.option("--device-id", type=int, help="Rebuild the rollups of one device only.")
+def backfill(device_id):
+    """Rebuild the hourly and daily rollups from the raw data table."""
+    written = rebuild_rollups(device_id)
+    click.echo(f"Rebuilt {written} rollup rows.")
@@ -0,0 +1,14 @@
+import click
+from flask.cli import AppGroup
+
+from services.summaries import rebuild_summaries
+
+cli = AppGroup("summary", help="Maintenance of the device summaries.")
+
+
+@cli.command("backfill")
+@click.option("--device-id", type=int, help="Rebuild the summary of one device only.")
+def backfill(device_id):
+    """Rebuild the latest readings and device summaries from the data table."""
+    summarized = rebuild_summaries(device_id)
+    click.echo(f"Summarized {summarized} devices.")
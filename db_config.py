@@ -0,0 +1,165 @@
+import os
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.exhausted = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = Lock()
+
+    def record(self, wait, exhausted):
+        with self._lock:
+            self.checkouts += 1
+            self.exhausted += exhausted
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "exhausted": self.exhausted,
+                "timeouts": self.timeouts,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    # records how long each checkout waited and how often every connection
+    # of the pool, overflow included, was already in use
+    def _do_get(self):
+        exhausted = 0 <= self._max_overflow and (
+            self.checkedout() >= self.size() + self._max_overflow
+        )
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_timeout()
+            raise
+        finally:
+            pool_stats.record(perf_counter() - started, exhausted)
+
+
+def _env(name, default, parse, valid, requirement):
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = parse(raw)
+    except ValueError:
+        value = None
+    if value is None or not valid(value):
+        raise ValueError(f"{name} must be {requirement}, got {raw!r}.")
+    return value
+
+
+def _flag(raw):
+    if raw.lower() in ("1", "true", "yes", "on"):
+        return True
+    if raw.lower() in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(raw)
+
+
+def load_database_config():
+    # reads and validates the database performance settings from the
+    # environment
+    return {
+        "DB_POOL_SIZE": _env(
+            "DB_POOL_SIZE", 10, int, lambda v: v >= 1, "a positive integer"
+        ),
+        "DB_MAX_OVERFLOW": _env(
+            "DB_MAX_OVERFLOW", 20, int, lambda v: v >= -1, "an integer >= -1"
+        ),
+        "DB_POOL_TIMEOUT": _env(
+            "DB_POOL_TIMEOUT", 30.0, float, lambda v: v > 0, "a positive number"
+        ),
+        "DB_POOL_RECYCLE": _env(
+            "DB_POOL_RECYCLE", 1800, int, lambda v: v >= -1, "an integer >= -1"
+        ),
+        "DB_POOL_PRE_PING": _env(
+            "DB_POOL_PRE_PING", True, _flag, lambda v: True, "a boolean"
+        ),
+        "DB_STATEMENT_TIMEOUT_MS": _env(
+            "DB_STATEMENT_TIMEOUT_MS", 0, int, lambda v: v >= 0, "an integer >= 0"
+        ),
+        "SQLITE_JOURNAL_MODE": _env(
+            "SQLITE_JOURNAL_MODE",
+            "WAL",
+            str.upper,
+            lambda v: v in ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+            "a SQLite journal mode",
+        ),
+        "SQLITE_SYNCHRONOUS": _env(
+            "SQLITE_SYNCHRONOUS",
+            "NORMAL",
+            str.upper,
+            lambda v: v in ("OFF", "NORMAL", "FULL", "EXTRA"),
+            "OFF, NORMAL, FULL or EXTRA",
+        ),
+        "SQLITE_BUSY_TIMEOUT_MS": _env(
+            "SQLITE_BUSY_TIMEOUT_MS", 5000, int, lambda v: v >= 0, "an integer >= 0"
+        ),
+    }
+
+
+def engine_options(database_url, config):
+    # SQLALCHEMY_ENGINE_OPTIONS for the backend of the database url
+    url = make_url(database_url)
+
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # in-memory databases live in a single connection
+            return {}
+        return {
+            "poolclass": InstrumentedQueuePool,
+            "pool_size": config["DB_POOL_SIZE"],
+            "max_overflow": config["DB_MAX_OVERFLOW"],
+            "pool_timeout": config["DB_POOL_TIMEOUT"],
+        }
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+    if url.get_backend_name() == "postgresql" and config["DB_STATEMENT_TIMEOUT_MS"]:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+        }
+    return options
+
+
+def configure_engine(engine, config):
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT_MS']}")
+        cursor.close()
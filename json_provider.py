@@ -0,0 +1,71 @@
+from flask.json.provider import DefaultJSONProvider
+
+from services.metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+# Flask's provider with the encoding timed in the serialization span of the
+# request metrics; subclasses override _dumps and _response
+class JSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with metrics.span("serialization"):
+            return self._dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with metrics.span("serialization"):
+            return self._response(*args, **kwargs)
+
+    def _dumps(self, obj, **kwargs):
+        return super().dumps(obj, **kwargs)
+
+    def _response(self, *args, **kwargs):
+        return super().response(*args, **kwargs)
+
+
+class OrjsonProvider(JSONProvider):
+    # orjson for responses and request bodies; keyword arguments meant for
+    # json.dumps/json.loads fall back to the standard library, and datetimes
+    # still go through Flask's default to keep their HTTP date format
+    def _dumps(self, obj, **kwargs):
+        if kwargs:
+            return super()._dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def _response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._option() | orjson.OPT_APPEND_NEWLINE
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option),
+            mimetype=self.mimetype,
+        )
+
+    def _option(self):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+
+def json_provider_class(name):
+    # "auto" uses orjson when it is installed
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name == "orjson":
+        if orjson is None:
+            raise ValueError("JSON_PROVIDER is 'orjson' but orjson is not installed.")
+        return OrjsonProvider
+    if name == "json":
+        return JSONProvider
+    raise ValueError("JSON_PROVIDER must be 'auto', 'orjson' or 'json'.")
@@ -0,0 +1,58 @@
+"""
+Duplicate rows in the "data_type" table are merged: readings that reference a
+duplicate are moved to the row with the lowest id and the duplicates are
+deleted.
+A unique constraint named "uq_data_type_name_unit" is added on the "name" and
+"unit" columns of the "data_type" table.
+
+Revision ID: 3c9a61d27e4b
+Revises: ad787fff640a
+Create Date: 2026-10-18 12:40:11.204518
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3c9a61d27e4b"
+down_revision = "ad787fff640a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    duplicates = connection.execute(
+        sa.text(
+            "SELECT name, unit, MIN(id) FROM data_type "
+            "GROUP BY name, unit HAVING COUNT(*) > 1"
+        )
+    ).fetchall()
+
+    for name, unit, keep_id in duplicates:
+        params = {"name": name, "unit": unit, "keep_id": keep_id}
+        connection.execute(
+            sa.text(
+                "UPDATE data SET data_type_id = :keep_id WHERE data_type_id IN "
+                "(SELECT id FROM data_type WHERE name = :name AND unit = :unit "
+                "AND id <> :keep_id)"
+            ),
+            params,
+        )
+        connection.execute(
+            sa.text(
+                "DELETE FROM data_type WHERE name = :name AND unit = :unit "
+                "AND id <> :keep_id"
+            ),
+            params,
+        )
+
+    with op.batch_alter_table("data_type", schema=None) as batch_op:
+        batch_op.create_unique_constraint("uq_data_type_name_unit", ["name", "unit"])
+
+
+def downgrade():
+    with op.batch_alter_table("data_type", schema=None) as batch_op:
+        batch_op.drop_constraint("uq_data_type_name_unit", type_="unique")
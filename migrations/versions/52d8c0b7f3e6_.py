@@ -0,0 +1,45 @@
+"""
+Duplicate jti values in the "token_blocklist" table are removed, keeping the
+row with the lowest id.
+A unique index named "ix_token_blocklist_jti" is created on the "jti" column.
+A new nullable column named "expires_at" is added to store when the revoked
+token expires, so that rows of expired tokens can be purged.
+Indexes are created on the "revoked_at" and "expires_at" columns.
+
+Revision ID: 52d8c0b7f3e6
+Revises: 7b20e4f8a9d1
+Create Date: 2026-10-18 13:31:09.774102
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "52d8c0b7f3e6"
+down_revision = "7b20e4f8a9d1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "DELETE FROM token_blocklist WHERE id NOT IN "
+        "(SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM token_blocklist "
+        "GROUP BY jti) AS kept)"
+    )
+
+    with op.batch_alter_table("token_blocklist", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("expires_at", sa.DateTime(), nullable=True))
+        batch_op.create_index("ix_token_blocklist_jti", ["jti"], unique=True)
+        batch_op.create_index("ix_token_blocklist_revoked_at", ["revoked_at"])
+        batch_op.create_index("ix_token_blocklist_expires_at", ["expires_at"])
+
+
+def downgrade():
+    with op.batch_alter_table("token_blocklist", schema=None) as batch_op:
+        batch_op.drop_index("ix_token_blocklist_expires_at")
+        batch_op.drop_index("ix_token_blocklist_revoked_at")
+        batch_op.drop_index("ix_token_blocklist_jti")
+        batch_op.drop_column("expires_at")
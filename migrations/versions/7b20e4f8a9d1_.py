@@ -0,0 +1,35 @@
+"""
+A new table named "cache_versions" has been added. Every row holds a counter
+that is incremented whenever the cached data it names changes, so that all
+application processes can invalidate their local caches.
+The "devices" counter is created with version 0.
+
+Revision ID: 7b20e4f8a9d1
+Revises: 3c9a61d27e4b
+Create Date: 2026-10-18 13:02:47.518230
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7b20e4f8a9d1"
+down_revision = "3c9a61d27e4b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_versions = op.create_table(
+        "cache_versions",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.bulk_insert(cache_versions, [{"name": "devices", "version": 0}])
+
+
+def downgrade():
+    op.drop_table("cache_versions")
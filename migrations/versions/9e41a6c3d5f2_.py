@@ -0,0 +1,35 @@
+"""
+A composite index named "ix_data_device_type_time" is created on the
+"device_id", "data_type_id" and "generation_time" columns of the "data" table
+to serve time range queries of a single device and data type. On PostgreSQL
+the index also includes the "id" and "generated_value" columns, so the
+queries are answered from the index alone.
+
+Revision ID: 9e41a6c3d5f2
+Revises: 52d8c0b7f3e6
+Create Date: 2026-10-18 14:05:52.310947
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9e41a6c3d5f2"
+down_revision = "52d8c0b7f3e6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_data_device_type_time",
+        "data",
+        ["device_id", "data_type_id", "generation_time"],
+        postgresql_include=["id", "generated_value"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_data_device_type_time", table_name="data")
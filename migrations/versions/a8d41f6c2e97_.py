@@ -0,0 +1,129 @@
+"""
+With DATA_PARTITIONING=1 on PostgreSQL the "data" table is converted into a
+table partitioned by range of the "generation_time" column. Each month gets
+its own partition named "data_pYYYY_MM", from the month of the oldest reading
+up to three months ahead, and readings outside of them go into the
+"data_default" partition. The primary key becomes ("id", "generation_time")
+since the key of a partitioned table has to contain the partition column. The
+existing readings are copied into the new table. On other databases, or
+without DATA_PARTITIONING, nothing is changed.
+
+Revision ID: a8d41f6c2e97
+Revises: e5b93c07a1d4
+Create Date: 2026-10-18 19:02:44.120836
+
+"""
+
+import os
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a8d41f6c2e97"
+down_revision = "e5b93c07a1d4"
+branch_labels = None
+depends_on = None
+
+COLUMNS = "id, generated_value, generation_time, data_type_id, device_id"
+MONTHS_AHEAD = 3
+
+
+def next_month(month):
+    if month.month == 12:
+        return datetime(month.year + 1, 1, 1)
+    return datetime(month.year, month.month + 1, 1)
+
+
+def is_partitioned(bind):
+    return bind.execute(
+        sa.text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass('data'))"
+        )
+    ).scalar()
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or os.getenv("DATA_PARTITIONING") != "1":
+        return
+    if is_partitioned(bind):
+        return
+
+    op.execute("ALTER TABLE data RENAME TO data_unpartitioned")
+    op.execute("ALTER INDEX data_pkey RENAME TO data_unpartitioned_pkey")
+    op.execute(
+        "ALTER INDEX ix_data_device_type_time "
+        "RENAME TO ix_data_unpartitioned_device_type_time"
+    )
+
+    op.execute("""
+        CREATE TABLE data (
+            id integer NOT NULL DEFAULT nextval('data_id_seq'),
+            generated_value double precision NOT NULL,
+            generation_time timestamp without time zone NOT NULL,
+            data_type_id integer NOT NULL REFERENCES data_type (id),
+            device_id integer NOT NULL REFERENCES devices (id),
+            PRIMARY KEY (id, generation_time)
+        ) PARTITION BY RANGE (generation_time)
+        """)
+    op.execute("ALTER SEQUENCE data_id_seq OWNED BY data.id")
+    op.execute(
+        "CREATE INDEX ix_data_device_type_time ON data "
+        "(device_id, data_type_id, generation_time) INCLUDE (id, generated_value)"
+    )
+    op.execute("CREATE TABLE data_default PARTITION OF data DEFAULT")
+
+    now = datetime.utcnow()
+    oldest = bind.execute(
+        sa.text("SELECT min(generation_time) FROM data_unpartitioned")
+    ).scalar()
+    month = datetime(*(oldest or now).timetuple()[:2], 1)
+    last = datetime(now.year, now.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        last = next_month(last)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE data_p{month.year:04d}_{month.month:02d} "
+            f"PARTITION OF data FOR VALUES FROM ('{month.isoformat()}') "
+            f"TO ('{next_month(month).isoformat()}')"
+        )
+        month = next_month(month)
+
+    op.execute(f"INSERT INTO data ({COLUMNS}) SELECT {COLUMNS} FROM data_unpartitioned")
+    op.execute("DROP TABLE data_unpartitioned")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not is_partitioned(bind):
+        return
+
+    op.execute("ALTER TABLE data RENAME TO data_partitioned")
+    op.execute(
+        "ALTER INDEX ix_data_device_type_time "
+        "RENAME TO ix_data_partitioned_device_type_time"
+    )
+    op.execute("""
+        CREATE TABLE data (
+            id integer NOT NULL DEFAULT nextval('data_id_seq'),
+            generated_value double precision NOT NULL,
+            generation_time timestamp without time zone NOT NULL,
+            device_id integer NOT NULL REFERENCES devices (id),
+            data_type_id integer NOT NULL,
+            CONSTRAINT data_pkey PRIMARY KEY (id),
+            CONSTRAINT "FK_data_data_type" FOREIGN KEY (data_type_id)
+                REFERENCES data_type (id)
+        )
+        """)
+    op.execute("ALTER SEQUENCE data_id_seq OWNED BY data.id")
+    op.execute(
+        "CREATE INDEX ix_data_device_type_time ON data "
+        "(device_id, data_type_id, generation_time) INCLUDE (id, generated_value)"
+    )
+    op.execute(f"INSERT INTO data ({COLUMNS}) SELECT {COLUMNS} FROM data_partitioned")
+    # drops the partitions along with it
+    op.execute("DROP TABLE data_partitioned")
@@ -0,0 +1,32 @@
+"""
+A "retention" row is added to the "cache_versions" table. Its version holds
+the minute, counted from the Unix epoch, until which the process that last
+started the retention job holds the lease on it, so that only one process
+runs the job per interval. It starts at 0, an expired lease.
+
+Revision ID: b3e8a1d6f4c9
+Revises: f7a3c95e1b28
+Create Date: 2026-10-18 23:12:37.604118
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b3e8a1d6f4c9"
+down_revision = "f7a3c95e1b28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_versions = sa.table(
+        "cache_versions", sa.column("name", sa.String), sa.column("version", sa.Integer)
+    )
+    op.bulk_insert(cache_versions, [{"name": "retention", "version": 0}])
+
+
+def downgrade():
+    op.execute("DELETE FROM cache_versions WHERE name = 'retention'")
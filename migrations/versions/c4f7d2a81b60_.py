@@ -0,0 +1,44 @@
+"""
+A new table named "data_rollup" has been added to store pre-aggregated
+readings (count, sum, min and max) per device, data type and hourly or daily
+bucket. The primary key ("device_id", "data_type_id", "bucket",
+"bucket_start") also serves range queries over the buckets.
+The table is filled at ingest; existing readings are aggregated with
+"flask rollup backfill".
+
+Revision ID: c4f7d2a81b60
+Revises: 9e41a6c3d5f2
+Create Date: 2026-10-18 14:48:20.661783
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c4f7d2a81b60"
+down_revision = "9e41a6c3d5f2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "data_rollup",
+        sa.Column("device_id", sa.Integer(), nullable=False),
+        sa.Column("data_type_id", sa.Integer(), nullable=False),
+        sa.Column("bucket", sa.String(length=8), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("sum", sa.Float(), nullable=False),
+        sa.Column("min", sa.Float(), nullable=False),
+        sa.Column("max", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["data_type_id"], ["data_type.id"]),
+        sa.ForeignKeyConstraint(["device_id"], ["devices.id"]),
+        sa.PrimaryKeyConstraint("device_id", "data_type_id", "bucket", "bucket_start"),
+    )
+
+
+def downgrade():
+    op.drop_table("data_rollup")
@@ -0,0 +1,31 @@
+"""
+A nullable column named "retention_days" has been added to the "data_type"
+table. Readings of a data type with a retention are deleted by the retention
+job once they are older than that many days, readings of the other data
+types are kept.
+
+Revision ID: d2f86b4c0e15
+Revises: a8d41f6c2e97
+Create Date: 2026-10-18 20:11:37.905214
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d2f86b4c0e15"
+down_revision = "a8d41f6c2e97"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("data_type", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("retention_days", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("data_type", schema=None) as batch_op:
+        batch_op.drop_column("retention_days")
@@ -0,0 +1,48 @@
+"""
+An index named "ix_devices_status" is created on the "status" column of the
+"devices" table for the filtered device listings. On PostgreSQL an index named
+"ix_devices_serial_number_pattern" with the "varchar_pattern_ops" operator
+class is created on the "serial_number" column, so serial number prefix
+filters use an index scan. A "device_listing" row is added to the
+"cache_versions" table, it is incremented whenever a device is registered.
+
+Revision ID: e5b93c07a1d4
+Revises: c4f7d2a81b60
+Create Date: 2026-10-18 16:21:08.446105
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e5b93c07a1d4"
+down_revision = "c4f7d2a81b60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_devices_status", "devices", ["status"])
+
+    cache_versions = sa.table(
+        "cache_versions", sa.column("name", sa.String), sa.column("version", sa.Integer)
+    )
+    op.bulk_insert(cache_versions, [{"name": "device_listing", "version": 0}])
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.create_index(
+            "ix_devices_serial_number_pattern",
+            "devices",
+            ["serial_number"],
+            postgresql_ops={"serial_number": "varchar_pattern_ops"},
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_devices_serial_number_pattern", table_name="devices")
+
+    op.execute("DELETE FROM cache_versions WHERE name = 'device_listing'")
+    op.drop_index("ix_devices_status", table_name="devices")
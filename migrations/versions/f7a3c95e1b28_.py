@@ -0,0 +1,51 @@
+"""
+Two tables are added for the device summaries. The "latest_reading" table
+holds the newest reading of every device and data type, and the
+"device_summary" table holds the number of readings of every device, the
+generation times of its first and last reading and when its last readings
+arrived. Both are kept up to date at ingest; existing readings are summarized
+with "flask summary backfill".
+
+Revision ID: f7a3c95e1b28
+Revises: d2f86b4c0e15
+Create Date: 2026-10-18 21:26:03.548390
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f7a3c95e1b28"
+down_revision = "d2f86b4c0e15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "latest_reading",
+        sa.Column("device_id", sa.Integer(), nullable=False),
+        sa.Column("data_type_id", sa.Integer(), nullable=False),
+        sa.Column("generated_value", sa.Float(), nullable=False),
+        sa.Column("generation_time", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["data_type_id"], ["data_type.id"]),
+        sa.ForeignKeyConstraint(["device_id"], ["devices.id"]),
+        sa.PrimaryKeyConstraint("device_id", "data_type_id"),
+    )
+    op.create_table(
+        "device_summary",
+        sa.Column("device_id", sa.Integer(), nullable=False),
+        sa.Column("reading_count", sa.BigInteger(), nullable=False),
+        sa.Column("first_time", sa.DateTime(), nullable=False),
+        sa.Column("last_time", sa.DateTime(), nullable=False),
+        sa.Column("last_seen", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["device_id"], ["devices.id"]),
+        sa.PrimaryKeyConstraint("device_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("device_summary")
+    op.drop_table("latest_reading")
@@ -5,3 +5,7 @@ from models.data import DataModel
 from models.user import UserModel
 from models.admin import AdminModel
 from models.tokenblocklist import TokenBlocklist
+from models.cache_version import CacheVersion
+from models.data_rollup import DataRollup
+from models.latest_reading import LatestReading
+from models.device_summary import DeviceSummary
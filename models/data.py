@@ -3,6 +3,15 @@ from db import db
 
 class DataModel(db.Model):
     __tablename__ = "data"
+    __table_args__ = (
+        db.Index(
+            "ix_data_device_type_time",
+            "device_id",
+            "data_type_id",
+            "generation_time",
+            postgresql_include=["id", "generated_value"],
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     generated_value = db.Column(db.Float, nullable=False)
@@ -0,0 +1,17 @@
+from db import db
+
+
+class DataRollup(db.Model):
+    __tablename__ = "data_rollup"
+
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+    data_type_id = db.Column(
+        db.Integer, db.ForeignKey("data_type.id"), primary_key=True
+    )
+    bucket = db.Column(db.String(8), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+
+    count = db.Column(db.Integer, nullable=False)
+    sum = db.Column(db.Float, nullable=False)
+    min = db.Column(db.Float, nullable=False)
+    max = db.Column(db.Float, nullable=False)
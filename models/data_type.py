@@ -3,7 +3,12 @@ from db import db
 
 class DataType(db.Model):
     __tablename__ = "data_type"
+    __table_args__ = (
+        db.UniqueConstraint("name", "unit", name="uq_data_type_name_unit"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     unit = db.Column(db.String(80), nullable=False)
+    # readings older than this many days are pruned, None keeps them forever
+    retention_days = db.Column(db.Integer, nullable=True)
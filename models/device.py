@@ -5,10 +5,19 @@ from models.user import UserModel
 
 class DeviceModel(UserModel):
     __tablename__ = "devices"
+    __table_args__ = (
+        # serial number prefix filters on PostgreSQL, whose default collation
+        # can not serve LIKE 'prefix%' from the unique index
+        db.Index(
+            "ix_devices_serial_number_pattern",
+            "serial_number",
+            postgresql_ops={"serial_number": "varchar_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
     serial_number = db.Column(db.String(256), unique=True, nullable=False)
-    status = db.Column(db.Enum(DeviceStatus), nullable=False)
+    status = db.Column(db.Enum(DeviceStatus), nullable=False, index=True)
 
     data = db.relationship("DataModel", back_populates="device", lazy="dynamic")
 
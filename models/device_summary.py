@@ -0,0 +1,13 @@
+from db import db
+
+
+class DeviceSummary(db.Model):
+    __tablename__ = "device_summary"
+
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+
+    reading_count = db.Column(db.BigInteger, nullable=False)
+    first_time = db.Column(db.DateTime, nullable=False)
+    last_time = db.Column(db.DateTime, nullable=False)
+    # when the last readings arrived, not their generation time
+    last_seen = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,13 @@
+from db import db
+
+
+class LatestReading(db.Model):
+    __tablename__ = "latest_reading"
+
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+    data_type_id = db.Column(
+        db.Integer, db.ForeignKey("data_type.id"), primary_key=True
+    )
+
+    generated_value = db.Column(db.Float, nullable=False)
+    generation_time = db.Column(db.DateTime, nullable=False)
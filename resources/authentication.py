@@ -1,14 +1,15 @@
-from datetime import datetime, timezone
+import hashlib
+
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from flask import jsonify
+from flask import Response, jsonify, request
 from flask_jwt_extended import (
     create_access_token,
     get_jwt,
     jwt_required,
     get_jwt_identity,
 )
-from passlib.hash import pbkdf2_sha256
+from sqlalchemy import select, update
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
 
 from schemas import (
@@ -17,9 +18,20 @@ from schemas import (
     RegistrationUpdateSchema,
     DeviceSchema,
     DeviceTokenSchema,
+    DeviceListQuerySchema,
+    DeviceFilterQuerySchema,
+    BulkRegistrationUpdateSchema,
+    BulkRegistrationUpdateResultSchema,
 )
 
-from models import DeviceModel, DeviceStatus, AdminModel, TokenBlocklist
+from models import DeviceModel, DeviceStatus, AdminModel, UserModel
+from services import (
+    device_status_cache,
+    password_cache,
+    password_hasher,
+    token_blocklist,
+)
+from serializers import CompiledSchema
 from db import db
 
 
@@ -27,8 +39,68 @@ blp = Blueprint(
     "auth", __name__, description="Registration and login operations for devices."
 )
 
-device_schema = DeviceSchema()
-login_schema = DeviceTokenSchema()
+device_schema = CompiledSchema(DeviceSchema)
+login_schema = CompiledSchema(DeviceTokenSchema)
+
+DEVICE_COLUMNS = {
+    "id": DeviceModel.__table__.c.id,
+    "serial_number": DeviceModel.__table__.c.serial_number,
+    "username": UserModel.__table__.c.username,
+    "status": DeviceModel.__table__.c.status,
+}
+
+
+def list_devices(query_args, status=None):
+    # keyset page of devices ordered by id; the ETag changes with the device
+    # listing version, which every registration and status change bumps
+    if query_args.get("status"):
+        status = DeviceStatus[query_args["status"]]
+    only = set(query_args.get("only") or DEVICE_COLUMNS)
+    etag = hashlib.sha1(
+        repr(
+            (
+                request.path,
+                device_status_cache.listing_version(),
+                status,
+                sorted(only),
+                query_args.get("serial_prefix"),
+                query_args.get("limit"),
+                query_args.get("cursor"),
+            )
+        ).encode()
+    ).hexdigest()
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    # weak comparison, compressed responses carry the ETag as a weak one
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    devices = DeviceModel.__table__
+    # only the users table join is needed for the username
+    columns = {name: DEVICE_COLUMNS[name] for name in only}
+    columns.setdefault("id", devices.c.id)
+    query = select(*columns.values()).select_from(devices)
+    if "username" in columns:
+        users = UserModel.__table__
+        query = query.join(users, users.c.id == devices.c.id)
+    if status is not None:
+        query = query.where(devices.c.status == status)
+    if query_args.get("serial_prefix"):
+        query = query.where(
+            devices.c.serial_number.startswith(
+                query_args["serial_prefix"], autoescape=True
+            )
+        )
+    if query_args.get("cursor") is not None:
+        query = query.where(devices.c.id > query_args["cursor"])
+
+    limit = query_args.get("limit")
+    rows = db.session.execute(query.order_by(devices.c.id).limit(limit + 1)).all()
+    page = rows[:limit]
+    if len(rows) > limit:
+        headers["X-Next-Cursor"] = str(page[-1].id)
+
+    response = CompiledSchema(DeviceSchema, only=only, many=True).dump(page)
+    return jsonify(response), 200, headers
 
 
 @blp.route("/auth/login/<int:id>")
@@ -44,8 +116,8 @@ class Login(MethodView):
             if not device:
                 abort(404, message="Device not found or invalid ID provided.")
 
-            if device.username != username or not pbkdf2_sha256.verify(
-                password, device.password
+            if device.username != username or not password_cache.verify(
+                device.id, password, device.password
             ):
                 abort(401, message="Invalid credentials.")
 
@@ -97,8 +169,10 @@ class Registration(MethodView):
                 if device.status == DeviceStatus.DELETED:
                     device.status = DeviceStatus.CREATED
                     device.usermane = username
-                    device.password = pbkdf2_sha256.hash(password)
+                    device.password = password_hasher.hash(password)
 
+                    device_status_cache.invalidate(device.id)
+                    password_cache.invalidate(device.id)
                     db.session.commit()
 
                     access_token = create_access_token(identity=device.id)
@@ -110,12 +184,13 @@ class Registration(MethodView):
 
             new_device = DeviceModel(
                 username=username,
-                password=pbkdf2_sha256.hash(password),
+                password=password_hasher.hash(password),
                 serial_number=serial_number,
                 status=DeviceStatus.CREATED,
             )
 
             db.session.add(new_device)
+            device_status_cache.invalidate_listing()
             db.session.commit()
 
             access_token = create_access_token(identity=new_device.id)
@@ -138,16 +213,22 @@ class RegistrationStatus(MethodView):
         device_id = get_jwt_identity()
 
         try:
-            device = DeviceModel.query.get(device_id)
-            if not device:
+            status = device_status_cache.get_status(device_id)
+            if status is None:
                 abort(404, message="Device not found.")
 
-            if device.status != DeviceStatus.APPROVED:
-                if device.status == DeviceStatus.BLACKLISTED:
+            # blacklisted devices are rejected without loading the device,
+            # every other response contains the device itself
+            if status != DeviceStatus.BLACKLISTED:
+                device = DeviceModel.query.get(device_id)
+                if not device:
+                    abort(404, message="Device not found.")
+                status = device.status
+
+            if status != DeviceStatus.APPROVED:
+                if status == DeviceStatus.BLACKLISTED:
                     # revoke device token
-                    jti = get_jwt()["jti"]
-                    time = datetime.now(timezone.utc)
-                    db.session.add(TokenBlocklist(jti=jti, revoked_at=time))
+                    token_blocklist.revoke(get_jwt())
                     db.session.commit()
                     abort(403, message="Access to the requested resource is forbidden.")
 
@@ -188,6 +269,7 @@ class RegistrationUpdate(MethodView):
                 abort(404, message="Device not found or invalid ID provided.")
 
             device.status = DeviceStatus[new_status]
+            device_status_cache.invalidate(device.id)
             db.session.commit()
             device_json = device_schema.dump(device)
             return jsonify(device_json), 200
@@ -199,6 +281,69 @@ class RegistrationUpdate(MethodView):
             abort(500, message="An error occured while updating device.")
 
 
+# {"status": "APPROVED", "device_ids": [1, 2]} or
+# {"status": "APPROVED", "filter": {"status": "CREATED", "serial_prefix": "SN-24"}}
+@blp.route("/devices/status")
+class BulkRegistrationUpdate(MethodView):
+    @jwt_required()
+    @blp.arguments(BulkRegistrationUpdateSchema, location="json")
+    @blp.response(200, BulkRegistrationUpdateResultSchema)
+    def patch(self, payload_data):
+        user_id = get_jwt_identity()
+
+        try:
+            user = AdminModel.query.get(user_id)
+
+            if not user:
+                abort(403, message="Access to the requested resource is forbidden.")
+
+            new_status = DeviceStatus[payload_data.get("status")]
+
+            # one set-based UPDATE for the whole selection
+            devices = DeviceModel.__table__
+            query = update(devices).values(status=new_status)
+            device_ids = payload_data.get("device_ids")
+            if device_ids is not None:
+                query = query.where(devices.c.id.in_(device_ids))
+            else:
+                filters = payload_data.get("filter")
+                if filters.get("status"):
+                    query = query.where(
+                        devices.c.status == DeviceStatus[filters["status"]]
+                    )
+                if filters.get("serial_prefix"):
+                    query = query.where(
+                        devices.c.serial_number.startswith(
+                            filters["serial_prefix"], autoescape=True
+                        )
+                    )
+
+            updated_ids = db.session.execute(query.returning(devices.c.id)).scalars()
+            updated_ids = set(updated_ids)
+            if updated_ids:
+                device_status_cache.invalidate(*updated_ids)
+            db.session.commit()
+
+            # ids that do not belong to a device
+            failed = sorted(set(device_ids or ()) - updated_ids)
+            return (
+                jsonify(
+                    {
+                        "status": new_status.name,
+                        "updated": len(updated_ids),
+                        "failed": failed,
+                    }
+                ),
+                200,
+            )
+        except KeyError:
+            abort(400, message="Invalid device status provided.")
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occured while updating devices.")
+
+
 @blp.route("/auth/delete/<int:id>")
 class DeleteRegistration(MethodView):
     @blp.arguments(HeaderSchema, location="headers")
@@ -212,8 +357,8 @@ class DeleteRegistration(MethodView):
             if not device:
                 abort(404, message="Device not found or invalid ID provided.")
 
-            if device.username != username or not pbkdf2_sha256.verify(
-                password, device.password
+            if device.username != username or not password_cache.verify(
+                device.id, password, device.password
             ):
                 abort(401, message="Invalid credentials.")
 
@@ -224,6 +369,7 @@ class DeleteRegistration(MethodView):
                 abort(403, message="Device is already deleted.")
 
             device.status = DeviceStatus.DELETED
+            device_status_cache.invalidate(device.id)
 
             db.session.commit()
 
@@ -238,8 +384,9 @@ class DeleteRegistration(MethodView):
 @blp.route("/devices/all")
 class AllDevices(MethodView):
     @jwt_required()
+    @blp.arguments(DeviceFilterQuerySchema, location="query")
     @blp.response(200, DeviceSchema(many=True))
-    def get(self):
+    def get(self, query_args):
         user_id = get_jwt_identity()
 
         try:
@@ -248,7 +395,7 @@ class AllDevices(MethodView):
             if not user:
                 abort(403, message="Access to the requested resource is forbidden.")
 
-            return DeviceModel.query.all()
+            return list_devices(query_args)
         except OperationalError:
             abort(500, message="Error connecting to the database.")
         except SQLAlchemyError:
@@ -258,8 +405,9 @@ class AllDevices(MethodView):
 @blp.route("/devices/requests")
 class DevicesRequests(MethodView):
     @jwt_required()
+    @blp.arguments(DeviceListQuerySchema, location="query")
     @blp.response(200, DeviceSchema(many=True))
-    def get(self):
+    def get(self, query_args):
         user_id = get_jwt_identity()
 
         try:
@@ -268,7 +416,7 @@ class DevicesRequests(MethodView):
             if not user:
                 abort(403, message="Access to the requested resource is forbidden.")
 
-            return DeviceModel.query.filter_by(status=DeviceStatus.CREATED).all()
+            return list_devices(query_args, DeviceStatus.CREATED)
         except OperationalError:
             abort(500, message="Error connecting to the database.")
         except SQLAlchemyError:
@@ -1,67 +1,630 @@
+import base64
+import binascii
+import csv
+import io
+import json
+import math
+import struct
+from functools import wraps
+
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from flask import jsonify
+from flask import Response, current_app, jsonify, request, stream_with_context
 from flask_jwt_extended import get_jwt, jwt_required, get_jwt_identity
+from sqlalchemy import func, or_, select
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
-from schemas import DataSchema
+from schemas import (
+    DataSchema,
+    DataQuerySchema,
+    DataPageSchema,
+    DataAggregateQuerySchema,
+    DataAggregateSchema,
+    DataExportQuerySchema,
+    DataTypeSchema,
+    DeviceSummarySchema,
+)
 
-from models import DataModel, DataType, DeviceModel, DeviceStatus, TokenBlocklist
+from models import AdminModel, DataRollup, DataType, DeviceStatus
+from services import (
+    data_type_cache,
+    device_status_cache,
+    ingest_queue,
+    token_blocklist,
+)
+from services.compression import accepts_compressed_body
+from services.ingest import write_readings
+from services.partitions import data_source
+from services.rollups import ROLLUP_BUCKETS
+from services.summaries import device_summaries
+from services.timeseries import bucket_floor, bucket_start, bucket_time
+from serializers import CompiledSchema
+from validators import lean_arguments, validate_reading, validate_readings
 from db import db
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 blp = Blueprint("data", __name__, description="Endpoint for receiving data.")
 
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_COLUMNS = ["time", "data_type_id", "name", "unit", "value"]
+
+# binary readings: data type id, milliseconds since the Unix epoch in UTC
+# (0 for the time of arrival) and value, little-endian, 20 bytes each
+READING_RECORD = struct.Struct("<Iqd")
+EPOCH = datetime(1970, 1, 1)
+# the message of marshmallow's Float field, like the JSON endpoints
+NON_FINITE_VALUE = "Special numeric values (nan or infinity) are not permitted."
+
+data_page_schema = CompiledSchema(DataPageSchema)
+device_summary_schema = CompiledSchema(DeviceSummarySchema)
+
+
+def check_device_approved(device_id):
+    status = device_status_cache.get_status(device_id)
+    if status is None:
+        abort(404, message="Device not found.")
+
+    if status != DeviceStatus.APPROVED:
+        if status == DeviceStatus.BLACKLISTED:
+            # revoke device token
+            token_blocklist.revoke(get_jwt())
+            db.session.commit()
+        abort(403, message="Access to the requested resource is forbidden.")
+
+
+def naive_utc(time):
+    # generation times are stored as naive UTC datetimes
+    if time is not None and time.tzinfo is not None:
+        time = time.astimezone(timezone.utc).replace(tzinfo=None)
+    return time
+
+
+def store_readings(rows):
+    # returns False when the readings were only queued for the write-behind
+    # writer instead of being committed; times with an offset are converted
+    # to UTC here, so they compare with the bounds of the read endpoints
+    for row in rows:
+        row["generation_time"] = naive_utc(row["generation_time"])
+
+    if ingest_queue.enabled:
+        if not ingest_queue.submit(rows):
+            abort(
+                503,
+                message="The server is too busy to accept new data. "
+                "Please try again later.",
+                headers={"Retry-After": "1"},
+            )
+        return False
+
+    write_readings(rows)
+    db.session.commit()
+    return True
+
+
+def limit_batch_size(func):
+    # rejects batches of more than DATA_BATCH_MAX_SIZE readings before they
+    # are validated one by one; the parsed body is cached on the request
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        payload = request.get_json(silent=True)
+        max_size = current_app.config["DATA_BATCH_MAX_SIZE"]
+        if type(payload) is list and len(payload) > max_size:
+            abort(413, message=f"The batch can contain at most {max_size} readings.")
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def check_data_access(device_id):
+    # devices can read their own data, admins can read data of every device
+    user_id = get_jwt_identity()
+    if user_id != device_id and not AdminModel.query.get(user_id):
+        abort(403, message="Access to the requested resource is forbidden.")
+
+    if device_status_cache.get_status(device_id) is None:
+        abort(404, message="Device not found.")
+
+
+def query_data_type_id(query_args):
+    data_type_id = query_args.get("data_type_id")
+    if data_type_id is None:
+        data_type_id = data_type_cache.lookup(query_args["name"], query_args["unit"])
+        if data_type_id is None:
+            abort(404, message="Data type not found.")
+    return data_type_id
+
+
+def use_rollups(bucket, start, end):
+    # rollups hold whole buckets, so they only answer ranges that start and
+    # end on bucket boundaries
+    if not current_app.config["DATA_ROLLUPS_ENABLED"] or bucket not in ROLLUP_BUCKETS:
+        return False
+    return all(
+        time is None or bucket_floor(time, bucket) == time for time in (start, end)
+    )
+
+
+def encode_cursor(time, id):
+    cursor = f"{time.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        time, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(time), int(id)
+    except (ValueError, binascii.Error):
+        abort(400, message="Invalid cursor.")
+
 
 # {"value":"11", "unit":"Celsius","name": "Temperature"}
 @blp.route("/data")
 class DataResource(MethodView):
     @jwt_required()
-    @blp.arguments(DataSchema)
+    @accepts_compressed_body
+    @lean_arguments(blp, DataSchema, validate_reading)
     @blp.response(201, description="New data added successfully.")
     def post(self, data_payload):
         device_id = get_jwt_identity()
 
         try:
-            device = DeviceModel.query.filter_by(id=device_id).first()
-            if not device:
-                abort(404, message="Device not found.")
-
-            if device.status != DeviceStatus.APPROVED:
-                if device.status == DeviceStatus.BLACKLISTED:
-                    # revoke device token
-                    jti = get_jwt()["jti"]
-                    time = datetime.now(timezone.utc)
-                    db.session.add(TokenBlocklist(jti=jti, revoked_at=time))
-                    db.session.commit()
-                abort(403, message="Access to the requested resource is forbidden.")
+            check_device_approved(device_id)
 
             value = data_payload.get("value")
             name = data_payload.get("name")
             unit = data_payload.get("unit")
             time = data_payload.get("time")
 
-            data_type = DataType.query.filter_by(name=name, unit=unit).first()
-            if not data_type:
-                data_type = DataType(name=name, unit=unit)
-                db.session.add(data_type)
-                db.session.commit()
+            data_type_id = data_type_cache.resolve(name, unit)
 
             if time is None:
                 time = datetime.utcnow()
 
-            new_data = DataModel(
-                generated_value=value,
-                generation_time=time,
-                data_type_id=data_type.id,
-                device_id=device_id,
+            stored = store_readings(
+                [
+                    {
+                        "generated_value": value,
+                        "generation_time": time,
+                        "data_type_id": data_type_id,
+                        "device_id": device_id,
+                    }
+                ]
             )
-
-            db.session.add(new_data)
-            db.session.commit()
+            if not stored:
+                return jsonify(message="New data accepted for processing."), 202
 
             return jsonify(message="New data added successfully."), 201
         except OperationalError:
             abort(500, message="Error connecting to the database.")
         except SQLAlchemyError:
             abort(500, message="An error occurred while accessing the database.")
+
+
+# [{"value":"11", "unit":"Celsius","name": "Temperature"}, ...]
+@blp.route("/data/batch")
+class DataBatchResource(MethodView):
+    @jwt_required()
+    @accepts_compressed_body
+    @limit_batch_size
+    @lean_arguments(blp, DataSchema(many=True), validate_readings)
+    @blp.response(201, description="New data added successfully.")
+    def post(self, data_payload):
+        device_id = get_jwt_identity()
+
+        if not data_payload:
+            abort(400, message="The batch does not contain any data.")
+
+        try:
+            check_device_approved(device_id)
+
+            data_type_ids = data_type_cache.resolve_many(
+                (reading.get("name"), reading.get("unit")) for reading in data_payload
+            )
+
+            now = datetime.utcnow()
+            rows = [
+                {
+                    "generated_value": reading.get("value"),
+                    "generation_time": reading.get("time") or now,
+                    "data_type_id": data_type_ids[
+                        (reading.get("name"), reading.get("unit"))
+                    ],
+                    "device_id": device_id,
+                }
+                for reading in data_payload
+            ]
+
+            if not store_readings(rows):
+                return (
+                    jsonify(
+                        message="New data accepted for processing.", count=len(rows)
+                    ),
+                    202,
+                )
+
+            return (
+                jsonify(message="New data added successfully.", count=len(rows)),
+                201,
+            )
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+# READING_RECORD structs back to back, data type ids come from /data/types
+@blp.route("/data/binary")
+class DataBinaryResource(MethodView):
+    @jwt_required()
+    @accepts_compressed_body
+    @blp.doc(
+        requestBody={
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            },
+        }
+    )
+    @blp.response(201, description="New data added successfully.")
+    def post(self):
+        device_id = get_jwt_identity()
+
+        body = request.get_data()
+        if not body:
+            abort(400, message="The batch does not contain any data.")
+        if len(body) % READING_RECORD.size:
+            abort(
+                400,
+                message=f"The body must consist of {READING_RECORD.size} byte readings.",
+            )
+
+        max_size = current_app.config["DATA_BATCH_MAX_SIZE"]
+        if len(body) // READING_RECORD.size > max_size:
+            abort(413, message=f"The batch can contain at most {max_size} readings.")
+
+        now = datetime.utcnow()
+        rows = []
+        try:
+            for data_type_id, timestamp, value in READING_RECORD.iter_unpack(body):
+                if not math.isfinite(value):
+                    abort(422, message=NON_FINITE_VALUE)
+                rows.append(
+                    {
+                        "generated_value": value,
+                        "generation_time": (
+                            EPOCH + timedelta(milliseconds=timestamp)
+                            if timestamp
+                            else now
+                        ),
+                        "data_type_id": data_type_id,
+                        "device_id": device_id,
+                    }
+                )
+        except OverflowError:
+            abort(400, message="Invalid reading timestamp.")
+
+        try:
+            check_device_approved(device_id)
+
+            unknown = data_type_cache.unknown_ids(row["data_type_id"] for row in rows)
+            if unknown:
+                ids = ", ".join(str(id) for id in sorted(unknown))
+                abort(422, message=f"Unknown data type ids: {ids}.")
+
+            if not store_readings(rows):
+                return (
+                    jsonify(
+                        message="New data accepted for processing.", count=len(rows)
+                    ),
+                    202,
+                )
+
+            return (
+                jsonify(message="New data added successfully.", count=len(rows)),
+                201,
+            )
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+# {"name": "Temperature", "unit": "Celsius"}
+@blp.route("/data/types")
+class DataTypes(MethodView):
+    @jwt_required()
+    @blp.response(200, DataTypeSchema(many=True))
+    def get(self):
+        try:
+            return DataType.query.order_by(DataType.id).all()
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+    # returns the id of the data type, creating it when it does not exist
+    @jwt_required()
+    @blp.arguments(DataTypeSchema)
+    @blp.response(200, DataTypeSchema)
+    def post(self, payload_data):
+        name = payload_data.get("name")
+        unit = payload_data.get("unit")
+
+        try:
+            data_type_id = data_type_cache.resolve(name, unit)
+            return jsonify(id=data_type_id, name=name, unit=unit), 200
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+# latest reading of every data type and reading counters of all devices
+@blp.route("/devices/summary")
+class DeviceSummaries(MethodView):
+    @jwt_required()
+    @blp.response(200, DeviceSummarySchema(many=True))
+    def get(self):
+        try:
+            if not AdminModel.query.get(get_jwt_identity()):
+                abort(403, message="Access to the requested resource is forbidden.")
+
+            summaries = device_summaries()
+            return jsonify(device_summary_schema.dump(summaries, many=True)), 200
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+@blp.route("/devices/<int:device_id>/summary")
+class DeviceDataSummary(MethodView):
+    @jwt_required()
+    @blp.response(200, DeviceSummarySchema)
+    def get(self, device_id):
+        try:
+            check_data_access(device_id)
+
+            (summary,) = device_summaries(device_id)
+            return jsonify(device_summary_schema.dump(summary)), 200
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+# /devices/1/data?name=Temperature&unit=Celsius&start=2024-01-01T00:00:00
+@blp.route("/devices/<int:device_id>/data")
+class DeviceData(MethodView):
+    @jwt_required()
+    @blp.arguments(DataQuerySchema, location="query")
+    @blp.response(200, DataPageSchema)
+    def get(self, query_args, device_id):
+        limit = query_args.get("limit")
+        start = naive_utc(query_args.get("start"))
+        end = naive_utc(query_args.get("end"))
+
+        try:
+            check_data_access(device_id)
+            data_type_id = query_data_type_id(query_args)
+
+            # keyset pagination over (generation_time, id), served by the
+            # (device_id, data_type_id, generation_time) index
+            data = data_source(start, end)
+            query = select(data.c.id, data.c.generated_value, data.c.generation_time)
+            query = query.where(
+                data.c.device_id == device_id, data.c.data_type_id == data_type_id
+            )
+            if start is not None:
+                query = query.where(data.c.generation_time >= start)
+            if end is not None:
+                query = query.where(data.c.generation_time < end)
+            if query_args.get("cursor"):
+                time, id = decode_cursor(query_args["cursor"])
+                query = query.where(
+                    data.c.generation_time >= time,
+                    or_(data.c.generation_time > time, data.c.id > id),
+                )
+            query = query.order_by(data.c.generation_time, data.c.id).limit(limit + 1)
+
+            rows = db.session.execute(query).all()
+
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1].generation_time, rows[-1].id)
+
+            response = data_page_schema.dump(
+                {
+                    "data_type_id": data_type_id,
+                    "data": [
+                        {
+                            "id": row.id,
+                            "value": row.generated_value,
+                            "time": row.generation_time,
+                        }
+                        for row in rows
+                    ],
+                    "next_cursor": next_cursor,
+                }
+            )
+            return jsonify(response), 200
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+# /devices/1/data/aggregate?name=Temperature&unit=Celsius&bucket=1h
+@blp.route("/devices/<int:device_id>/data/aggregate")
+class DeviceDataAggregate(MethodView):
+    @jwt_required()
+    @blp.arguments(DataAggregateQuerySchema, location="query")
+    @blp.response(200, DataAggregateSchema)
+    def get(self, query_args, device_id):
+        bucket = query_args.get("bucket")
+        start = naive_utc(query_args.get("start"))
+        end = naive_utc(query_args.get("end"))
+
+        try:
+            check_data_access(device_id)
+            data_type_id = query_data_type_id(query_args)
+
+            if use_rollups(bucket, start, end):
+                # O(buckets) read of the pre-aggregated rollups
+                query = select(
+                    DataRollup.bucket_start,
+                    DataRollup.count,
+                    DataRollup.min,
+                    DataRollup.max,
+                    DataRollup.sum / DataRollup.count,
+                ).where(
+                    DataRollup.device_id == device_id,
+                    DataRollup.data_type_id == data_type_id,
+                    DataRollup.bucket == bucket,
+                )
+                if start is not None:
+                    query = query.where(DataRollup.bucket_start >= start)
+                if end is not None:
+                    query = query.where(DataRollup.bucket_start < end)
+                query = query.order_by(DataRollup.bucket_start)
+            else:
+                data = data_source(start, end)
+                time = bucket_start(
+                    data.c.generation_time, bucket, db.session.get_bind().dialect.name
+                ).label("time")
+                query = select(
+                    time,
+                    func.count(),
+                    func.min(data.c.generated_value),
+                    func.max(data.c.generated_value),
+                    func.avg(data.c.generated_value),
+                ).where(
+                    data.c.device_id == device_id, data.c.data_type_id == data_type_id
+                )
+                if start is not None:
+                    query = query.where(data.c.generation_time >= start)
+                if end is not None:
+                    query = query.where(data.c.generation_time < end)
+                query = query.group_by(time).order_by(time)
+
+            rows = db.session.execute(query).all()
+
+            # columnar arrays instead of one serialized object per bucket
+            times, counts, minimums, maximums, averages = (
+                zip(*rows) if rows else ((), (), (), (), ())
+            )
+            return (
+                jsonify(
+                    data_type_id=data_type_id,
+                    bucket=bucket,
+                    time=[bucket_time(value).isoformat() for value in times],
+                    count=list(counts),
+                    min=list(minimums),
+                    max=list(maximums),
+                    avg=[float(value) for value in averages],
+                ),
+                200,
+            )
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+
+def export_lines(rows, format):
+    if format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(
+            (
+                row.generation_time.isoformat(),
+                row.data_type_id,
+                row.name,
+                row.unit,
+                row.generated_value,
+            )
+            for row in rows
+        )
+        return buffer.getvalue()
+
+    lines = (
+        json.dumps(
+            {
+                "time": row.generation_time.isoformat(),
+                "data_type_id": row.data_type_id,
+                "name": row.name,
+                "unit": row.unit,
+                "value": row.generated_value,
+            }
+        )
+        for row in rows
+    )
+    return "".join(f"{line}\n" for line in lines)
+
+
+# /devices/1/data/export?format=csv&start=2024-01-01T00:00:00
+@blp.route("/devices/<int:device_id>/data/export")
+class DeviceDataExport(MethodView):
+    @jwt_required()
+    @blp.arguments(DataExportQuerySchema, location="query")
+    @blp.response(200, description="Readings streamed as NDJSON or CSV.")
+    def get(self, query_args, device_id):
+        format = query_args.get("format")
+        start = naive_utc(query_args.get("start"))
+        end = naive_utc(query_args.get("end"))
+
+        try:
+            check_data_access(device_id)
+
+            data = data_source(start, end)
+            data_types = DataType.__table__
+            query = (
+                select(
+                    data.c.generation_time,
+                    data.c.data_type_id,
+                    data_types.c.name,
+                    data_types.c.unit,
+                    data.c.generated_value,
+                )
+                .join(data_types, data_types.c.id == data.c.data_type_id)
+                .where(data.c.device_id == device_id)
+            )
+            if "data_type_id" in query_args or "name" in query_args:
+                query = query.where(
+                    data.c.data_type_id == query_data_type_id(query_args)
+                )
+            if start is not None:
+                query = query.where(data.c.generation_time >= start)
+            if end is not None:
+                query = query.where(data.c.generation_time < end)
+            # follows the (device_id, data_type_id, generation_time) index
+            query = query.order_by(
+                data.c.data_type_id, data.c.generation_time, data.c.id
+            )
+        except OperationalError:
+            abort(500, message="Error connecting to the database.")
+        except SQLAlchemyError:
+            abort(500, message="An error occurred while accessing the database.")
+
+        def generate():
+            if format == "csv":
+                yield ",".join(EXPORT_COLUMNS) + "\n"
+
+            # yield_per streams the result from a server-side cursor, so only
+            # one chunk of rows is held in memory at a time
+            result = db.session.execute(
+                query.execution_options(yield_per=EXPORT_CHUNK_SIZE)
+            )
+            for rows in result.partitions():
+                yield export_lines(rows, format)
+
+        mimetype = "text/csv" if format == "csv" else "application/x-ndjson"
+        return Response(
+            stream_with_context(generate()),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=device-{device_id}.{format}"
+            },
+        )
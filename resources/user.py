@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta
 from flask.views import MethodView
 from flask_jwt_extended import (
     create_access_token,
@@ -8,13 +8,13 @@ from flask_jwt_extended import (
 )
 from flask_smorest import Blueprint, abort
 from flask import jsonify
-from passlib.hash import pbkdf2_sha256
 
 from sqlalchemy.exc import SQLAlchemyError, OperationalError
 
 from schemas import HeaderSchema, UserLoginSchema, UserSchema
 
-from models import AdminModel, TokenBlocklist
+from models import AdminModel
+from services import password_hasher, token_blocklist
 from db import db
 
 blp = Blueprint("user", __name__, description="User registration")
@@ -37,7 +37,7 @@ class Registration(MethodView):
                 abort(409, message="A user with that username already exists.")
 
             new_user = AdminModel(
-                username=username, password=pbkdf2_sha256.hash(password), role="admin"
+                username=username, password=password_hasher.hash(password), role="admin"
             )
 
             db.session.add(new_user)
@@ -63,7 +63,7 @@ class Login(MethodView):
             if not user:
                 abort(404, message="A user with that username not found.")
 
-            if not pbkdf2_sha256.verify(password, user.password):
+            if not password_hasher.verify(password, user.password):
                 abort(401, message="Invalid credentials.")
 
             access_token = create_access_token(
@@ -83,9 +83,7 @@ class Logout(MethodView):
     def get(self):
         # revoke user token
         try:
-            jti = get_jwt()["jti"]
-            time = datetime.now(timezone.utc)
-            db.session.add(TokenBlocklist(jti=jti, revoked_at=time))
+            token_blocklist.revoke(get_jwt())
             db.session.commit()
             return jsonify(message="The user was successfully logged out."), 200
         except OperationalError:
@@ -1,6 +1,16 @@
-from marshmallow import Schema, fields
+import marshmallow
+from marshmallow import ValidationError, fields, validate, validates_schema
 from marshmallow_enum import EnumField
+from webargs.fields import DelimitedList
 from models import DeviceStatus
+from services.metrics import metrics
+
+
+# dumps are timed in the serialization span of the request metrics
+class Schema(marshmallow.Schema):
+    def dump(self, obj, *, many=None):
+        with metrics.span("serialization"):
+            return super().dump(obj, many=many)
 
 
 class HeaderSchema(Schema):
@@ -30,6 +40,55 @@ class DeviceTokenSchema(Schema):
     device = fields.Nested(DeviceSchema)
 
 
+class DeviceListQuerySchema(Schema):
+    serial_prefix = fields.String(validate=validate.Length(min=1))
+    only = DelimitedList(
+        fields.String(
+            validate=validate.OneOf(["id", "serial_number", "username", "status"])
+        ),
+        data_key="fields",
+    )
+    limit = fields.Integer(load_default=100, validate=validate.Range(min=1, max=1000))
+    cursor = fields.Integer()
+
+
+class DeviceFilterQuerySchema(DeviceListQuerySchema):
+    status = fields.String(
+        validate=validate.OneOf([status.name for status in DeviceStatus])
+    )
+
+
+class DeviceStatusFilterSchema(Schema):
+    status = fields.String(
+        validate=validate.OneOf([status.name for status in DeviceStatus])
+    )
+    serial_prefix = fields.String(validate=validate.Length(min=1))
+
+    @validates_schema
+    def validate_filter(self, data, **kwargs):
+        if not data:
+            raise ValidationError("Status or serial_prefix must be provided.")
+
+
+class BulkRegistrationUpdateSchema(Schema):
+    status = fields.String(required=True)
+    device_ids = fields.List(
+        fields.Integer(), validate=validate.Length(min=1, max=10000)
+    )
+    filter = fields.Nested(DeviceStatusFilterSchema)
+
+    @validates_schema
+    def validate_selection(self, data, **kwargs):
+        if ("device_ids" in data) == ("filter" in data):
+            raise ValidationError("Either device_ids or filter must be provided.")
+
+
+class BulkRegistrationUpdateResultSchema(Schema):
+    status = fields.String()
+    updated = fields.Integer()
+    failed = fields.List(fields.Integer())
+
+
 class DataSchema(Schema):
     value = fields.Float(required=True)
     unit = fields.String(required=True)
@@ -37,6 +96,89 @@ class DataSchema(Schema):
     time = fields.DateTime()
 
 
+class DataRangeSchema(Schema):
+    data_type_id = fields.Integer()
+    name = fields.String()
+    unit = fields.String()
+    start = fields.DateTime()
+    end = fields.DateTime()
+
+    @validates_schema
+    def validate_name_and_unit(self, data, **kwargs):
+        if ("name" in data) != ("unit" in data):
+            raise ValidationError("Name and unit must be provided together.")
+
+
+class DataTypeRangeSchema(DataRangeSchema):
+    @validates_schema
+    def validate_data_type(self, data, **kwargs):
+        if "data_type_id" not in data and ("name" not in data or "unit" not in data):
+            raise ValidationError(
+                "Either data_type_id or both name and unit are required."
+            )
+
+
+class DataQuerySchema(DataTypeRangeSchema):
+    limit = fields.Integer(load_default=100, validate=validate.Range(min=1, max=1000))
+    cursor = fields.String()
+
+
+class DataAggregateQuerySchema(DataTypeRangeSchema):
+    bucket = fields.String(required=True, validate=validate.OneOf(["1m", "1h", "1d"]))
+
+
+class DataExportQuerySchema(DataRangeSchema):
+    format = fields.String(
+        load_default="ndjson", validate=validate.OneOf(["ndjson", "csv"])
+    )
+
+
+class DataTypeSchema(Schema):
+    id = fields.Integer(dump_only=True)
+    name = fields.String(required=True, validate=validate.Length(min=1, max=80))
+    unit = fields.String(required=True, validate=validate.Length(min=1, max=80))
+    retention_days = fields.Integer(dump_only=True)
+
+
+class DataReadingSchema(Schema):
+    id = fields.Integer()
+    value = fields.Float()
+    time = fields.DateTime()
+
+
+class DataPageSchema(Schema):
+    data_type_id = fields.Integer()
+    data = fields.List(fields.Nested(DataReadingSchema))
+    next_cursor = fields.String(allow_none=True)
+
+
+class LatestReadingSchema(Schema):
+    data_type_id = fields.Integer()
+    name = fields.String()
+    unit = fields.String()
+    value = fields.Float()
+    time = fields.DateTime()
+
+
+class DeviceSummarySchema(Schema):
+    device_id = fields.Integer()
+    reading_count = fields.Integer()
+    first_time = fields.DateTime(allow_none=True)
+    last_time = fields.DateTime(allow_none=True)
+    last_seen = fields.DateTime(allow_none=True)
+    latest = fields.List(fields.Nested(LatestReadingSchema))
+
+
+class DataAggregateSchema(Schema):
+    data_type_id = fields.Integer()
+    bucket = fields.String()
+    time = fields.List(fields.DateTime())
+    count = fields.List(fields.Integer())
+    min = fields.List(fields.Float())
+    max = fields.List(fields.Float())
+    avg = fields.List(fields.Float())
+
+
 class UserSchema(Schema):
     id = fields.Integer(dump_only=True)
     username = fields.String(required=True)
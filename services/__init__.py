@@ -0,0 +1,10 @@
+from services.data_type_cache import data_type_cache
+from services.device_status_cache import device_status_cache
+from services.token_blocklist import token_blocklist
+from services.ingest_queue import ingest_queue
+from services.password_hasher import password_hasher
+from services.password_cache import password_cache
+from services.metrics import metrics
+from services.compression import response_compression
+from services.partitions import partition_maintenance
+from services.retention import retention_job
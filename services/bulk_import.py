@@ -0,0 +1,221 @@
+import csv
+import gzip
+import io
+import json
+import math
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import select
+
+from db import db
+from models import DataModel, DeviceModel
+from services.data_type_cache import data_type_cache
+from services.partitions import ensure_partitions, is_partitioned, month_start
+from services.rollups import apply_rollups
+from services.summaries import apply_summaries
+from validators import SPECIAL_NUMBER
+
+COPY_COLUMNS = ("generated_value", "generation_time", "data_type_id", "device_id")
+
+
+class ImportRecordError(ValueError):
+    # a record that cannot be imported, with the file and line it came from
+    def __init__(self, path, line, message):
+        super().__init__(f"{path}:{line}: {message}")
+
+
+def read_records(path, format=None):
+    # yields (line, record) pairs of a CSV file with a header row, records
+    # being dicts, or of an NDJSON file, records being the lines still to be
+    # decoded, so that a malformed line is one invalid record; the files may
+    # be gzip compressed and the format follows the extension unless given
+    name = path[:-3] if path.endswith(".gz") else path
+    if format is None:
+        format = "csv" if name.endswith(".csv") else "ndjson"
+    opener = gzip.open if path.endswith(".gz") else open
+
+    with opener(path, "rt", encoding="utf-8", newline="") as file:
+        if format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line, text in enumerate(file, 1):
+                if text.strip():
+                    yield line, text
+
+
+def decode_record(text):
+    try:
+        record = json.loads(text)
+    except ValueError:
+        raise ValueError("Invalid JSON.")
+    if not isinstance(record, dict):
+        raise ValueError("Expected a JSON object.")
+    return record
+
+
+def parse_time(value):
+    # generation times are stored as naive UTC datetimes
+    time = datetime.fromisoformat(value)
+    if time.tzinfo is not None:
+        time = time.astimezone(timezone.utc).replace(tzinfo=None)
+    return time
+
+
+# streams readings from files into the data table in chunks, one transaction
+# per chunk; data types are resolved once per (name, unit) pair and device
+# ids are checked once, so each record costs only its parsing
+class ReadingImporter:
+    def __init__(self, device_id=None, chunk_size=50000, skip_invalid=False):
+        self.device_id = device_id
+        self.chunk_size = chunk_size
+        self.skip_invalid = skip_invalid
+        self.imported = 0
+        self.skipped = 0
+        self._data_type_ids = {}
+        self._known_data_type_ids = set()
+        self._device_ids = None
+        self._partitioned = is_partitioned()
+        self._copy = db.engine.dialect.driver == "psycopg2"
+        self._sqlite = db.engine.dialect.name == "sqlite"
+
+    def import_file(self, path, format=None):
+        rows = []
+        for line, record in read_records(path, format):
+            try:
+                rows.append(self._row(record))
+            except (KeyError, TypeError, ValueError, OverflowError) as error:
+                if not self.skip_invalid:
+                    raise ImportRecordError(path, line, _describe(error))
+                self.skipped += 1
+                continue
+
+            if len(rows) >= self.chunk_size:
+                self._write(rows)
+                rows = []
+        if rows:
+            self._write(rows)
+
+    def _row(self, record):
+        if isinstance(record, str):
+            record = decode_record(record)
+        device_id = record.get("device_id") or self.device_id
+        if device_id is None:
+            raise ValueError("Missing device_id and no default device id.")
+        device_id = int(device_id)
+        if "data_type_id" in record and record["data_type_id"] not in ("", None):
+            data_type_id = int(record["data_type_id"])
+        else:
+            data_type_id = self._resolve(record["name"], record["unit"])
+        value = float(record["value"])
+        if not math.isfinite(value):
+            raise ValueError(SPECIAL_NUMBER)
+        return (
+            value,
+            parse_time(record["time"]),
+            data_type_id,
+            device_id,
+        )
+
+    def _resolve(self, name, unit):
+        data_type_id = self._data_type_ids.get((name, unit))
+        if data_type_id is None:
+            if not isinstance(name, str) or not isinstance(unit, str):
+                raise TypeError("The name and unit must be strings.")
+            data_type_id = data_type_cache.resolve(name, unit)
+            self._data_type_ids[(name, unit)] = data_type_id
+        return data_type_id
+
+    def _check_ids(self, rows):
+        if self._device_ids is None:
+            self._device_ids = set(db.session.execute(select(DeviceModel.id)).scalars())
+        unknown = {row[3] for row in rows} - self._device_ids
+        if unknown:
+            raise ValueError(f"Unknown device ids: {sorted(unknown)}.")
+
+        data_type_ids = {row[2] for row in rows} - self._known_data_type_ids
+        unknown = data_type_cache.unknown_ids(data_type_ids)
+        if unknown:
+            raise ValueError(f"Unknown data type ids: {sorted(unknown)}.")
+        self._known_data_type_ids |= data_type_ids
+
+    def _write(self, rows):
+        self._check_ids(rows)
+        if self._partitioned:
+            ensure_partitions({month_start(row[1]) for row in rows})
+
+        readings = [dict(zip(COPY_COLUMNS, row)) for row in rows]
+        if self._copy:
+            self._write_copy(rows)
+        elif self._sqlite:
+            self._write_executemany(rows)
+        else:
+            db.session.execute(DataModel.__table__.insert(), readings)
+
+        # derived tables are kept up to date in the same transaction, like
+        # at ingest
+        if current_app.config["DATA_ROLLUPS_ENABLED"]:
+            apply_rollups(readings)
+        if current_app.config["DATA_SUMMARIES_ENABLED"]:
+            apply_summaries(readings)
+        db.session.commit()
+        self.imported += len(rows)
+
+    def _write_executemany(self, rows):
+        # straight to the driver, skipping SQLAlchemy's per-row parameter
+        # processing except for the datetime format SQLAlchemy reads back
+        dialect = db.engine.dialect
+        time_type = DataModel.__table__.c.generation_time.type.dialect_impl(dialect)
+        time_to_db = time_type.bind_processor(dialect)
+        db.session.connection().exec_driver_sql(
+            f"INSERT INTO data ({', '.join(COPY_COLUMNS)}) VALUES (?, ?, ?, ?)",
+            [
+                (value, time_to_db(time), data_type_id, device_id)
+                for value, time, data_type_id, device_id in rows
+            ],
+        )
+
+    def _write_copy(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerows(
+            (value, time.isoformat(), data_type_id, device_id)
+            for value, time, data_type_id, device_id in rows
+        )
+        buffer.seek(0)
+
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY data ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        finally:
+            cursor.close()
+
+
+def _describe(error):
+    if isinstance(error, KeyError):
+        return f"Missing field {error.args[0]!r}."
+    return str(error)
+
+
+def drop_indexes():
+    # the secondary indexes of the data table, dropped before a large load
+    # and created again after it, which is faster than maintaining them row
+    # by row; returns the dropped indexes
+    indexes = list(DataModel.__table__.indexes)
+    connection = db.session.connection()
+    for index in indexes:
+        index.drop(connection, checkfirst=True)
+    db.session.commit()
+    return indexes
+
+
+def create_indexes(indexes):
+    connection = db.session.connection()
+    for index in indexes:
+        index.create(connection, checkfirst=True)
+    db.session.commit()
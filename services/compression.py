@@ -0,0 +1,124 @@
+import zlib
+from functools import wraps
+from io import BytesIO
+
+from flask import current_app, request
+from flask_smorest import abort
+
+# zlib window bits of the supported content codings
+WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def _compress_chunks(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# gzip/deflate compression of responses the client accepts compressed; only
+# allow-listed content types of at least min_size bytes are compressed, and
+# streamed responses are compressed chunk by chunk
+class ResponseCompression:
+    def __init__(self):
+        self.enabled = False
+        self.min_size = 1024
+        self.level = 6
+        self.mimetypes = set()
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def init_app(self, app):
+        self.enabled = app.config["COMPRESSION_ENABLED"]
+        self.min_size = app.config["COMPRESSION_MIN_SIZE"]
+        self.level = app.config["COMPRESSION_LEVEL"]
+        self.mimetypes = set(app.config["COMPRESSION_MIMETYPES"])
+        if self.enabled:
+            app.after_request(self.compress)
+
+    def compress(self, response):
+        skip = (
+            request.method == "HEAD",
+            not 200 <= response.status_code < 300,
+            response.status_code == 204,
+            response.direct_passthrough,
+            "Content-Encoding" in response.headers,
+            response.mimetype not in self.mimetypes,
+        )
+        if any(skip):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        coding = request.accept_encodings.best_match(list(WBITS))
+        if coding is None:
+            return response
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, WBITS[coding])
+        if response.is_streamed:
+            response.response = _compress_chunks(response.iter_encoded(), compressor)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            compressed = compressor.compress(data) + compressor.flush()
+            response.set_data(compressed)
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+
+        response.headers["Content-Encoding"] = coding
+        # the compressed body is a different representation of the resource
+        if response.headers.get("ETag", "").startswith('"'):
+            response.headers["ETag"] = "W/" + response.headers["ETag"]
+        return response
+
+    def stats(self):
+        return {
+            "compressed": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+response_compression = ResponseCompression()
+
+
+def accepts_compressed_body(func):
+    # lets the decorated view read gzip or deflate request bodies; the body
+    # is replaced by its decompressed content before anything parses it, up
+    # to REQUEST_MAX_DECOMPRESSED_SIZE bytes to guard against zip bombs,
+    # while MAX_CONTENT_LENGTH bounds the compressed body read first
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        coding = (request.content_encoding or "").strip().lower()
+        if coding and coding != "identity":
+            if coding not in WBITS:
+                abort(415, message=f"Unsupported content encoding {coding!r}.")
+
+            limit = current_app.config["REQUEST_MAX_DECOMPRESSED_SIZE"]
+            # deflate bodies may also come with a gzip header
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+            try:
+                body = decompressor.decompress(request.get_data(), limit + 1)
+            except zlib.error:
+                abort(400, message="Invalid compressed request body.")
+            if len(body) > limit or decompressor.unconsumed_tail:
+                abort(
+                    413,
+                    message=f"The decompressed request body exceeds {limit} bytes.",
+                )
+            if not decompressor.eof:
+                abort(400, message="Invalid compressed request body.")
+
+            request.environ["wsgi.input"] = BytesIO(body)
+            request.environ["CONTENT_LENGTH"] = str(len(body))
+            del request.environ["HTTP_CONTENT_ENCODING"]
+            # drop the compressed body read above
+            for cached in ("stream", "_cached_data"):
+                request.__dict__.pop(cached, None)
+        return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from models import DataType
+
+
+# process-local, bounded (name, unit) -> data type id cache; data types are
+# never updated once created so cached ids stay valid, and the least recently
+# used pair is evicted when the cache is full
+class DataTypeCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._ids = OrderedDict()
+        self._known_ids = set()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.max_size = app.config["DATA_TYPE_CACHE_SIZE"]
+
+    def resolve(self, name, unit):
+        return self.resolve_many([(name, unit)])[(name, unit)]
+
+    def lookup(self, name, unit):
+        # like resolve, but returns None instead of creating a missing type
+        return self.resolve_many([(name, unit)], create=False).get((name, unit))
+
+    def resolve_many(self, pairs, create=True):
+        resolved = {}
+        missing = set()
+
+        with self._lock:
+            for pair in set(pairs):
+                data_type_id = self._ids.get(pair)
+                if data_type_id is None:
+                    missing.add(pair)
+                    self.misses += 1
+                else:
+                    self._ids.move_to_end(pair)
+                    resolved[pair] = data_type_id
+                    self.hits += 1
+
+        if missing:
+            names = {name for name, _ in missing}
+            for data_type in DataType.query.filter(DataType.name.in_(names)):
+                pair = (data_type.name, data_type.unit)
+                if pair in missing:
+                    resolved[pair] = data_type.id
+                    missing.discard(pair)
+
+            if create:
+                for name, unit in missing:
+                    resolved[(name, unit)] = self._create(name, unit)
+
+            with self._lock:
+                for pair, data_type_id in resolved.items():
+                    self._ids[pair] = data_type_id
+                    self._ids.move_to_end(pair)
+                while len(self._ids) > self.max_size:
+                    self._ids.popitem(last=False)
+
+        return resolved
+
+    def unknown_ids(self, data_type_ids):
+        # the ids without a data type; ids seen once stay known because data
+        # types are never deleted
+        with self._lock:
+            unknown = set(data_type_ids) - self._known_ids
+        if not unknown:
+            return unknown
+
+        existing = set(
+            db.session.execute(
+                select(DataType.id).where(DataType.id.in_(unknown))
+            ).scalars()
+        )
+        with self._lock:
+            if len(self._known_ids) + len(existing) > self.max_size:
+                self._known_ids.clear()
+            self._known_ids.update(existing)
+        return unknown - existing
+
+    def _create(self, name, unit):
+        # the unique constraint on (name, unit) makes a concurrent insert from
+        # another worker fail, in which case the winner's row is used
+        try:
+            with db.session.begin_nested():
+                data_type = DataType(name=name, unit=unit)
+                db.session.add(data_type)
+        except IntegrityError:
+            data_type = DataType.query.filter_by(name=name, unit=unit).one()
+        data_type_id = data_type.id
+
+        # commit so that only persisted ids ever end up in the cache
+        db.session.commit()
+        return data_type_id
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._known_ids.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._ids),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+data_type_cache = DataTypeCache()
@@ -0,0 +1,140 @@
+from threading import Lock
+from time import monotonic
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from db import db
+from models import CacheVersion, DeviceModel
+
+
+# short-TTL device_id -> DeviceStatus cache; every process polls the shared
+# "devices" version counter and drops all entries as soon as another process
+# reports a device change, so the TTL only bounds staleness if polling fails
+class DeviceStatusCache:
+    VERSION_NAME = "devices"
+    # changes with every device status and with every new device, the admin
+    # device listings derive their ETags from both counters
+    LISTING_VERSION_NAME = "device_listing"
+    # session.info key of the device ids to drop once the session commits
+    PENDING_KEY = "device_status_invalidated"
+
+    def __init__(self, ttl=30.0, poll_interval=1.0):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._version = None
+        self._next_poll = 0.0
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config["DEVICE_STATUS_CACHE_TTL"]
+        self.poll_interval = app.config["DEVICE_STATUS_CACHE_POLL_INTERVAL"]
+        if not event.contains(Session, "after_commit", self._after_commit):
+            event.listen(Session, "after_commit", self._after_commit)
+            event.listen(Session, "after_rollback", self._after_rollback)
+
+    def get_status(self, device_id):
+        now = monotonic()
+        self._sync_version(now)
+
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # reads only the devices table instead of the polymorphic users join
+        devices = DeviceModel.__table__
+        status = db.session.execute(
+            select(devices.c.status).where(devices.c.id == device_id)
+        ).scalar()
+
+        if status is not None:
+            self.set(device_id, status)
+        return status
+
+    def set(self, device_id, status):
+        with self._lock:
+            self._entries[device_id] = (status, monotonic() + self.ttl)
+
+    def invalidate(self, *device_ids):
+        # the version bump is part of the caller's transaction, so other
+        # processes see it exactly when the status change is committed; the
+        # local entries are dropped after that commit too, before it a
+        # concurrent get_status could put the old status back
+        pending = db.session.info.setdefault(self.PENDING_KEY, set())
+        pending.update(device_ids)
+        self._bump(self.VERSION_NAME)
+
+    def _after_commit(self, session):
+        device_ids = session.info.pop(self.PENDING_KEY, None)
+        if not device_ids:
+            return
+        with self._lock:
+            for device_id in device_ids:
+                self._entries.pop(device_id, None)
+            # entries read while the change was committed are dropped by the
+            # next poll, which sees the new version
+            self._next_poll = 0.0
+
+    def _after_rollback(self, session):
+        session.info.pop(self.PENDING_KEY, None)
+
+    def invalidate_listing(self):
+        # a new device does not change any cached status
+        self._bump(self.LISTING_VERSION_NAME)
+
+    def listing_version(self):
+        return tuple(
+            db.session.execute(
+                select(CacheVersion.name, CacheVersion.version)
+                .where(
+                    CacheVersion.name.in_(
+                        [self.VERSION_NAME, self.LISTING_VERSION_NAME]
+                    )
+                )
+                .order_by(CacheVersion.name)
+            ).all()
+        )
+
+    def _bump(self, name):
+        db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._next_poll = 0.0
+
+    def _sync_version(self, now):
+        if now < self._next_poll:
+            return
+
+        version = db.session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == self.VERSION_NAME)
+        ).scalar()
+
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._next_poll = now + self.poll_interval
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "version": self._version,
+            }
+
+
+device_status_cache = DeviceStatusCache()
@@ -0,0 +1,288 @@
+import asyncio
+import math
+import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import monotonic, time
+
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, InvalidTokenError
+
+from db import db
+from models import DeviceStatus
+from services.data_type_cache import data_type_cache
+from services.device_status_cache import device_status_cache
+from services.ingest_queue import ingest_queue
+from services.token_blocklist import token_blocklist
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - uvloop is optional
+    uvloop = None
+
+EPOCH = datetime(1970, 1, 1)
+READ_SIZE = 65536
+MAX_LINE = 1024
+READING_FORMAT = "Expected '<data_type_id> <value> [<time_ms>]'."
+
+
+class GatewayError(Exception):
+    pass
+
+
+def parse_reading(line, device_id):
+    # "<data_type_id> <value> [<milliseconds since the Unix epoch>]", like
+    # the binary format a missing or 0 timestamp is the time of arrival
+    fields = line.split()
+    try:
+        if not 2 <= len(fields) <= 3:
+            raise ValueError
+        data_type_id = int(fields[0])
+        value = float(fields[1])
+        milliseconds = int(fields[2]) if len(fields) == 3 else 0
+    except ValueError:
+        raise ValueError(READING_FORMAT)
+    if not math.isfinite(value):
+        raise ValueError("The value must be a finite number.")
+    if milliseconds:
+        generation_time = EPOCH + timedelta(milliseconds=milliseconds)
+    else:
+        generation_time = datetime.utcnow()
+
+    return {
+        "generated_value": value,
+        "generation_time": generation_time,
+        "data_type_id": data_type_id,
+        "device_id": device_id,
+    }
+
+
+# line protocol gateway for devices keeping a TCP connection open: the device
+# sends "AUTH <access token>" once, then one reading per line, and "FLUSH" to
+# be answered once everything sent so far is stored. Tokens and device
+# statuses are checked with the same rules as the /data endpoints, and the
+# readings go through the shared write-behind writer in batches
+class Gateway:
+    def __init__(self, app):
+        self.app = app
+        self.auth_timeout = app.config["GATEWAY_AUTH_TIMEOUT"]
+        self.idle_timeout = app.config["GATEWAY_IDLE_TIMEOUT"] or None
+        self.status_interval = app.config["GATEWAY_STATUS_INTERVAL"]
+        self.submit_timeout = app.config["GATEWAY_SUBMIT_TIMEOUT"]
+        if ingest_queue.flush_rows > ingest_queue.max_size:
+            # such a batch would never fit into the queue
+            raise ValueError(
+                "INGEST_FLUSH_ROWS must not be larger than INGEST_QUEUE_SIZE."
+            )
+        self.connections = 0
+        self.peak_connections = 0
+        self.readings = 0
+        self.rejected = 0
+        self._known_data_type_ids = set()
+        # database work of the checks runs off the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config["GATEWAY_WORKERS"],
+            thread_name_prefix="gateway",
+        )
+
+    def run(self, host, port):
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        asyncio.run(self.serve(host, port))
+
+    async def serve(self, host, port, started=None):
+        server = await asyncio.start_server(
+            self._handle, host, port, limit=READ_SIZE, backlog=4096
+        )
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stopped.set)
+            except (RuntimeError, ValueError):
+                pass  # not the main thread
+
+        self.app.logger.info(
+            "Gateway listening on %s.",
+            ", ".join(str(sock.getsockname()) for sock in server.sockets),
+        )
+        if started is not None:
+            started(server)
+        try:
+            await stopped.wait()
+        finally:
+            server.close()
+            # buffered readings are written before the process exits
+            await loop.run_in_executor(None, ingest_queue.stop)
+            self._executor.shutdown()
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "peak_connections": self.peak_connections,
+            "readings": self.readings,
+            "rejected": self.rejected,
+        }
+
+    async def _call(self, func, *args):
+        def call():
+            with self.app.app_context():
+                try:
+                    return func(*args)
+                finally:
+                    db.session.remove()
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def _authorize(self, token):
+        # returns the claims of a valid access token of an approved device
+        try:
+            claims = decode_token(token)
+        except ExpiredSignatureError:
+            raise GatewayError("The token has expired.")
+        except (InvalidTokenError, JWTExtendedException):
+            raise GatewayError("Signature verification failed.")
+        if claims.get("type") != "access":
+            raise GatewayError("Signature verification failed.")
+
+        self._check(claims)
+        return claims
+
+    def _check(self, claims):
+        if token_blocklist.is_revoked(claims["jti"]):
+            raise GatewayError("The token has been revoked.")
+        if claims.get("exp") is not None and claims["exp"] <= time():
+            raise GatewayError("The token has expired.")
+
+        device_id = claims[self.app.config["JWT_IDENTITY_CLAIM"]]
+        status = device_status_cache.get_status(device_id)
+        if status is None:
+            raise GatewayError("Device not found.")
+        if status != DeviceStatus.APPROVED:
+            if status == DeviceStatus.BLACKLISTED:
+                token_blocklist.revoke(claims)
+                db.session.commit()
+            raise GatewayError("Access to the requested resource is forbidden.")
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+        # idle connections from devices that went away are noticed by TCP
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            await self._serve_connection(reader, writer)
+        except GatewayError as error:
+            writer.write(b"ERR " + str(error).encode() + b"\n")
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            self.app.logger.exception("Gateway connection failed.")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.auth_timeout)
+        except ValueError:
+            line = b""  # longer than the stream limit
+        command, _, token = line.strip().partition(b" ")
+        if command != b"AUTH" or not token:
+            raise GatewayError("Expected 'AUTH <access token>'.")
+
+        claims = await self._call(self._authorize, token.decode(errors="replace"))
+        device_id = claims[self.app.config["JWT_IDENTITY_CLAIM"]]
+        writer.write(b"OK " + str(device_id).encode() + b"\n")
+        checked = monotonic()
+
+        buffer = b""
+        line_number = 1
+        while True:
+            chunk = await asyncio.wait_for(reader.read(READ_SIZE), self.idle_timeout)
+            # a last line without a newline still counts
+            closed = not chunk
+            lines = (buffer + (chunk or b"\n")).split(b"\n")
+            buffer = lines.pop()
+            if len(buffer) > MAX_LINE:
+                raise GatewayError(f"Line {line_number + len(lines) + 1} is too long.")
+
+            # the token and device status are checked again now and then
+            if monotonic() - checked >= self.status_interval:
+                await self._call(self._check, claims)
+                checked = monotonic()
+
+            readings = []
+            for line in lines:
+                line_number += 1
+                line = line.strip()
+                if not line:
+                    continue
+                if line == b"FLUSH":
+                    accepted = await self._submit(readings, writer)
+                    readings = []
+                    await self._flush(accepted, writer)
+                    continue
+
+                try:
+                    readings.append((line_number, parse_reading(line, device_id)))
+                except (ValueError, OverflowError) as error:
+                    self.rejected += 1
+                    writer.write(b"ERR %d %s\n" % (line_number, str(error).encode()))
+
+            await self._submit(readings, writer)
+            if closed:
+                return
+            await writer.drain()
+
+    async def _submit(self, readings, writer):
+        # hands the readings to the writer, returns the writer position to
+        # wait for before they are stored
+        unknown = {row["data_type_id"] for _, row in readings}
+        unknown -= self._known_data_type_ids
+        if unknown:
+            unknown = await self._call(data_type_cache.unknown_ids, unknown)
+            self._known_data_type_ids.update(
+                row["data_type_id"]
+                for _, row in readings
+                if row["data_type_id"] not in unknown
+            )
+
+        rows = []
+        for line_number, row in readings:
+            if row["data_type_id"] in unknown:
+                self.rejected += 1
+                writer.write(b"ERR %d Unknown data type id.\n" % line_number)
+            else:
+                rows.append(row)
+
+        # a full queue stops reading from this connection until the writer
+        # catches up, which pushes back on the device over TCP; a queue that
+        # stays full for submit_timeout seconds, or that is shutting down,
+        # closes the connection instead
+        deadline = monotonic() + self.submit_timeout
+        size = ingest_queue.flush_rows
+        for start in range(0, len(rows), size):
+            end = start + size
+            batch = rows[start:end]
+            while not ingest_queue.submit(batch):
+                if ingest_queue.stopping:
+                    raise GatewayError("The gateway is shutting down.")
+                if monotonic() >= deadline:
+                    raise GatewayError("The ingest queue is full, retry later.")
+                await asyncio.sleep(ingest_queue.flush_interval)
+            self.readings += len(batch)
+        return ingest_queue.submitted
+
+    async def _flush(self, position, writer):
+        failed = ingest_queue.failed
+        while not ingest_queue.written(position):
+            await asyncio.sleep(ingest_queue.flush_interval / 4)
+
+        if ingest_queue.failed != failed:
+            writer.write(b"ERR An error occurred while storing the readings.\n")
+        else:
+            writer.write(b"OK\n")
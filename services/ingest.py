@@ -0,0 +1,18 @@
+from flask import current_app
+
+from db import db
+from models import DataModel
+from services.rollups import apply_rollups
+from services.summaries import apply_summaries
+
+
+def write_readings(rows):
+    # stores validated readings (dicts of data table columns) with a single
+    # executemany insert and keeps derived tables up to date, the caller
+    # commits the session
+    db.session.execute(DataModel.__table__.insert(), rows)
+
+    if current_app.config["DATA_ROLLUPS_ENABLED"]:
+        apply_rollups(rows)
+    if current_app.config["DATA_SUMMARIES_ENABLED"]:
+        apply_summaries(rows)
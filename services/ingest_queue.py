@@ -0,0 +1,154 @@
+import atexit
+import signal
+import sys
+import threading
+from time import monotonic
+
+from sqlalchemy.exc import OperationalError
+
+from db import db
+from services.ingest import write_readings
+
+
+# optional write-behind mode: validated readings are buffered in memory and a
+# background thread stores them in group commits of up to flush_rows readings
+# or every flush_interval seconds, trading durability of the buffered
+# readings for throughput
+class IngestQueue:
+    def __init__(self):
+        self.enabled = False
+        self.max_size = 10000
+        self.flush_rows = 500
+        self.flush_interval = 0.2
+        self.submitted = 0
+        self.flushed = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failed = 0
+        self.splits = 0
+        self._app = None
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def init_app(self, app):
+        self.enabled = app.config["INGEST_MODE"] == "write_behind"
+        self.max_size = app.config["INGEST_QUEUE_SIZE"]
+        self.flush_rows = app.config["INGEST_FLUSH_ROWS"]
+        self.flush_interval = app.config["INGEST_FLUSH_INTERVAL_MS"] / 1000
+        self._app = app
+
+        if self.enabled:
+            atexit.register(self.stop)
+            # make SIGTERM exit through atexit so that buffered readings are
+            # written, unless the server installed its own handler
+            main_thread = threading.current_thread() is threading.main_thread()
+            if main_thread and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    def submit(self, rows):
+        # returns False when the buffer is full and the readings were rejected
+        with self._condition:
+            if self._stopping or len(self._pending) + len(rows) > self.max_size:
+                self.rejected += len(rows)
+                return False
+
+            self._pending.extend(rows)
+            self.submitted += len(rows)
+            if len(self._pending) >= self.flush_rows:
+                self._condition.notify()
+
+        self._start()
+        return True
+
+    @property
+    def stopping(self):
+        # set for good once stop() was called, submit then rejects everything
+        return self._stopping
+
+    def stop(self, timeout=30):
+        # drains the buffer before returning
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                # started lazily, so forking servers start it in every
+                # worker, and started again should it ever have died
+                self._thread = threading.Thread(
+                    target=self._run, name="ingest-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                deadline = monotonic() + self.flush_interval
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._stopping or len(self._pending) >= self.flush_rows,
+                        timeout=max(deadline - monotonic(), 0),
+                    )
+                    rows = self._pending[: self.flush_rows]
+                    del self._pending[: self.flush_rows]
+                    done = self._stopping and not self._pending
+
+                if rows:
+                    self._flush(rows)
+                if done:
+                    return
+
+    def _flush(self, rows):
+        # a group commit that fails on some of its readings, e.g. on a
+        # constraint, is split in halves until only those are dropped, since
+        # the others were already acknowledged; a lost connection fails every
+        # part alike, so the whole group is dropped at once
+        try:
+            write_readings(rows)
+            db.session.commit()
+            self.flushed += len(rows)
+            self.batches += 1
+        except Exception as error:
+            # the readings are dropped rather than the writer thread
+            db.session.rollback()
+            if len(rows) > 1 and not isinstance(error, OperationalError):
+                self.splits += 1
+                middle = len(rows) // 2
+                self._flush(rows[:middle])
+                self._flush(rows[middle:])
+                return
+            self.failed += len(rows)
+            self._app.logger.exception(
+                "Failed to write %d buffered readings.", len(rows)
+            )
+        finally:
+            db.session.remove()
+
+    def written(self, position):
+        # whether the writer got past the readings submitted up to position,
+        # which is the value of submitted right after they were submitted
+        return self.flushed + self.failed >= position
+
+    def stats(self):
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "splits": self.splits,
+        }
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,204 @@
+import cProfile
+import os
+import random
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from threading import Lock
+
+from flask import Response, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_smorest import abort
+from sqlalchemy import event
+
+from db import db
+from models import AdminModel
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NO_SPAN = nullcontext()
+
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+        self.nested = False
+
+    def __enter__(self):
+        # a span opened inside one of the same name (a nested schema dump,
+        # jsonify calling dumps) is already being timed
+        self.nested = self.name in g._metrics_open
+        if not self.nested:
+            g._metrics_open.add(self.name)
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if not self.nested:
+            spans = g._metrics_spans
+            spans[self.name] = (
+                spans.get(self.name, 0.0) + time.perf_counter() - self.started
+            )
+            g._metrics_open.discard(self.name)
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.spans = {}
+
+
+# per-endpoint request timing with sql, auth and serialization spans; nothing
+# is registered unless METRICS_ENABLED is set. SQL is timed through engine
+# events, the spans are opened by the code doing that work with span()
+class RequestMetrics:
+    def __init__(self):
+        self.enabled = False
+        self.profile_rate = 0.0
+        self.profile_dir = None
+        self.profiled = 0
+        self.allowed_addresses = set()
+        self._endpoints = {}
+        self._sources = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config["METRICS_ENABLED"]
+        if not self.enabled:
+            return
+
+        self.profile_rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.profile_dir = app.config["PROFILE_DIR"]
+        self.allowed_addresses = set(app.config["METRICS_ALLOWED_ADDRESSES"])
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def register(self, name, stats):
+        # stats() of a service, exported as one gauge per numeric value
+        self._sources[name] = stats
+
+    def span(self, name):
+        if not self.enabled or not has_request_context() or "_metrics_spans" not in g:
+            return _NO_SPAN
+        return _Span(name)
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_spans = {}
+        g._metrics_open = set()
+        g._metrics_sql = [0, 0.0]
+        if self.profile_rate and random.random() < self.profile_rate:
+            g._metrics_profile = cProfile.Profile()
+            g._metrics_profile.enable()
+
+    def _after_request(self, response):
+        if "_metrics_started" not in g:
+            return response
+        elapsed = time.perf_counter() - g._metrics_started
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+
+        with self._lock:
+            stats = self._endpoints.get((endpoint, request.method))
+            if stats is None:
+                stats = self._endpoints[(endpoint, request.method)] = _EndpointStats()
+            stats.statuses[response.status_code] = (
+                stats.statuses.get(response.status_code, 0) + 1
+            )
+            stats.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.sql_queries += g._metrics_sql[0]
+            stats.sql_seconds += g._metrics_sql[1]
+            for name, seconds in g._metrics_spans.items():
+                stats.spans[name] = stats.spans.get(name, 0.0) + seconds
+        return response
+
+    def _teardown_request(self, exc):
+        profile = g.pop("_metrics_profile", None)
+        if profile is None:
+            return
+        profile.disable()
+        endpoint = request.endpoint or "unmatched"
+        filename = f"{endpoint.replace('.', '-')}-{time.time_ns()}.prof"
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile.dump_stats(os.path.join(self.profile_dir, filename))
+        with self._lock:
+            self.profiled += 1
+
+    def _before_cursor_execute(self, conn, cursor, statement, *args):
+        if has_request_context() and "_metrics_sql" in g:
+            conn.info.setdefault("_metrics_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, *args):
+        if has_request_context() and "_metrics_sql" in g:
+            started = conn.info["_metrics_started"].pop()
+            g._metrics_sql[0] += 1
+            g._metrics_sql[1] += time.perf_counter() - started
+
+    def _metrics_view(self):
+        # scrapers on an allowed address, otherwise admins only
+        if request.remote_addr not in self.allowed_addresses:
+            verify_jwt_in_request()
+            if not AdminModel.query.get(get_jwt_identity()):
+                abort(403, message="Access to the requested resource is forbidden.")
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    def render(self):
+        lines = [
+            "# TYPE api_requests_total counter",
+            "# TYPE api_request_duration_seconds histogram",
+            "# TYPE api_sql_queries_total counter",
+            "# TYPE api_sql_duration_seconds_total counter",
+            "# TYPE api_span_duration_seconds_total counter",
+        ]
+        with self._lock:
+            for (endpoint, method), stats in sorted(self._endpoints.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(
+                        f'api_requests_total{{{labels},status="{status}"}} {count}'
+                    )
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}}'
+                        f" {cumulative}"
+                    )
+                lines.append(
+                    f"api_request_duration_seconds_sum{{{labels}}} {stats.seconds}"
+                )
+                lines.append(
+                    f"api_request_duration_seconds_count{{{labels}}} {stats.count}"
+                )
+                lines.append(f"api_sql_queries_total{{{labels}}} {stats.sql_queries}")
+                lines.append(
+                    f"api_sql_duration_seconds_total{{{labels}}} {stats.sql_seconds}"
+                )
+                for name, seconds in sorted(stats.spans.items()):
+                    lines.append(
+                        f'api_span_duration_seconds_total{{{labels},span="{name}"}}'
+                        f" {seconds}"
+                    )
+            lines.append(f"api_profiles_total {self.profiled}")
+
+        for source, stats in sorted(self._sources.items()):
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"api_{source}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = RequestMetrics()
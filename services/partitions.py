@@ -0,0 +1,307 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from threading import Event, Thread
+
+from sqlalchemy import Column, Index, MetaData, Table, func, select, text, union_all
+
+from db import db
+from models import DataModel
+
+# monthly partitions of the data table are named data_pYYYY_MM, on PostgreSQL
+# they are partitions of the data table, on SQLite archive tables next to it
+PARTITION_NAME = re.compile(r"^data_p(\d{4})_(\d{2})$")
+DEFAULT_PARTITION = "data_default"
+
+# {database url: (schema version, partitions)} of SQLite databases, read by
+# data_source; every CREATE or DROP TABLE bumps the schema version, also
+# when another process (flask partitions, the retention job) runs it
+_sqlite_partitions = {}
+
+
+def month_start(time):
+    return datetime(time.year, time.month, 1)
+
+
+def next_month(month):
+    if month.month == 12:
+        return datetime(month.year + 1, 1, 1)
+    return datetime(month.year, month.month + 1, 1)
+
+
+def partition_name(month):
+    return f"data_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name):
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def is_partitioned():
+    # whether the data table was converted to a partitioned table
+    if _dialect() != "postgresql":
+        return False
+    return db.session.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass('data'))"
+        )
+    ).scalar()
+
+
+def list_partitions():
+    # (month, name) pairs of the monthly partitions, oldest first
+    if _dialect() == "postgresql":
+        names = db.session.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass('data')"
+            )
+        ).scalars()
+    else:
+        names = db.session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table'")
+        ).scalars()
+
+    partitions = [(partition_month(name), name) for name in names]
+    return sorted(partition for partition in partitions if partition[0] is not None)
+
+
+def create_partitions(months_ahead, now=None):
+    # creates the PostgreSQL partitions of the current and the next
+    # months_ahead months, returns the names of the created ones
+    months = [month_start(now or datetime.utcnow())]
+    for _ in range(months_ahead):
+        months.append(next_month(months[-1]))
+    return ensure_partitions(months)
+
+
+def ensure_partitions(months):
+    # creates the missing PostgreSQL partitions of the months the given
+    # times fall in, returns the names of the created ones
+    if not is_partitioned():
+        return []
+
+    # one process at a time, the lock is released by the commit
+    db.session.execute(
+        text("SELECT pg_advisory_xact_lock(hashtext('data_partitions'))")
+    )
+    existing = {name for _, name in list_partitions()}
+
+    created = []
+    for month in sorted({month_start(time) for time in months}):
+        name = partition_name(month)
+        if name not in existing:
+            _create_partition(name, month, next_month(month))
+            created.append(name)
+
+    db.session.commit()
+    return created
+
+
+def _create_partition(name, start, end):
+    # readings that arrived before the partition existed are in the default
+    # partition; they are moved first, otherwise attaching would fail
+    db.session.execute(
+        text(
+            f"CREATE TABLE {name} "
+            "(LIKE data INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    db.session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE generation_time >= :start AND generation_time < :end "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    db.session.execute(
+        text(
+            f"ALTER TABLE data ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+
+
+def expired_partitions(before):
+    # names of the partitions of the months ending on or before the given month
+    return [
+        name
+        for month, name in list_partitions()
+        if next_month(month) <= month_start(before)
+    ]
+
+
+def series_counts(name):
+    # {(device_id, data_type_id): readings} of a partition
+    table = archive_table(name)
+    rows = db.session.execute(
+        select(table.c.device_id, table.c.data_type_id, func.count()).group_by(
+            table.c.device_id, table.c.data_type_id
+        )
+    )
+    return {(device_id, data_type_id): count for device_id, data_type_id, count in rows}
+
+
+def drop_partitions(before):
+    # drops the partitions (archive tables on SQLite) of the months ending on
+    # or before the given month; dropping a table does not touch its rows, so
+    # this takes the same time for any amount of data
+    dropped = []
+    for name in expired_partitions(before):
+        if _dialect() == "postgresql":
+            db.session.execute(text(f"ALTER TABLE data DETACH PARTITION {name}"))
+        db.session.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+
+    db.session.commit()
+    return dropped
+
+
+@lru_cache(maxsize=None)
+def archive_table(name):
+    data = DataModel.__table__
+    return Table(
+        name,
+        MetaData(),
+        *(
+            Column(
+                column.name,
+                column.type,
+                primary_key=column.primary_key,
+                nullable=column.nullable,
+            )
+            for column in data.columns
+        ),
+        Index(
+            f"ix_{name}_device_type_time",
+            "device_id",
+            "data_type_id",
+            "generation_time",
+        ),
+    )
+
+
+def archive_partitions(before):
+    # SQLite has no partitioning: readings of the months before the given
+    # month move from the data table into one archive table per month,
+    # returns {name: rows moved}
+    if _dialect() != "sqlite":
+        raise ValueError("Archive tables are only used on SQLite.")
+
+    data = DataModel.__table__
+    cutoff = month_start(before)
+    oldest = db.session.execute(
+        select(data.c.generation_time)
+        .where(data.c.generation_time < cutoff)
+        .order_by(data.c.generation_time)
+        .limit(1)
+    ).scalar()
+
+    moved = {}
+    month = month_start(oldest) if oldest is not None else cutoff
+    while month < cutoff:
+        table = archive_table(partition_name(month))
+        in_month = (data.c.generation_time >= month) & (
+            data.c.generation_time < next_month(month)
+        )
+        table.create(db.session.connection(), checkfirst=True)
+        count = db.session.execute(
+            table.insert().from_select(
+                [column.name for column in data.columns],
+                select(*data.columns).where(in_month),
+            )
+        ).rowcount
+        db.session.execute(data.delete().where(in_month))
+        db.session.commit()
+        if count:
+            moved[table.name] = count
+        month = next_month(month)
+    return moved
+
+
+def _cached_partitions():
+    # list_partitions of SQLite, read again only when the schema changed
+    version = db.session.execute(text("PRAGMA schema_version")).scalar()
+    key = str(db.engine.url)
+    cached = _sqlite_partitions.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    partitions = list_partitions()
+    _sqlite_partitions[key] = (version, partitions)
+    return partitions
+
+
+def data_source(start=None, end=None):
+    # the table to read readings from; on SQLite the archive tables that
+    # overlap [start, end) are added with UNION ALL, the others are skipped
+    data = DataModel.__table__
+    if _dialect() != "sqlite":
+        return data
+
+    archives = [
+        archive_table(name)
+        for month, name in _cached_partitions()
+        if (start is None or next_month(month) > start) and (end is None or month < end)
+    ]
+    if not archives:
+        return data
+
+    return union_all(
+        select(*data.columns), *(select(*table.columns) for table in archives)
+    ).subquery("data_all")
+
+
+# keeps PostgreSQL partitions for the coming months in place from a daemon
+# thread, so readings do not pile up in the default partition
+class PartitionMaintenance:
+    def __init__(self):
+        self.interval = 3600.0
+        self.months_ahead = 3
+        self.runs = 0
+        self.created = 0
+        self._app = None
+        self._thread = None
+        self._stopped = Event()
+
+    def init_app(self, app):
+        self.interval = app.config["DATA_PARTITION_MAINTENANCE_INTERVAL"]
+        self.months_ahead = app.config["DATA_PARTITION_MONTHS_AHEAD"]
+        self._app = app
+
+        # only partitioned tables need it, which is checked on every run
+        postgresql = app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql")
+        if postgresql and self.interval > 0 and self._thread is None:
+            self._thread = Thread(
+                target=self._run, name="partition-maintenance", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._app.app_context():
+                try:
+                    self.created += len(create_partitions(self.months_ahead))
+                    self.runs += 1
+                except Exception:
+                    db.session.rollback()
+                    self._app.logger.exception("Creating data partitions failed.")
+                finally:
+                    db.session.remove()
+            self._stopped.wait(self.interval)
+
+    def stats(self):
+        return {"runs": self.runs, "created": self.created}
+
+
+partition_maintenance = PartitionMaintenance()
@@ -0,0 +1,73 @@
+import hashlib
+import hmac
+import secrets
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from services.password_hasher import password_hasher
+
+
+# bounded, short-TTL cache of successful password verifications; entries are
+# keyed by the user id and an HMAC (with a random per-process key) of the
+# supplied password and the stored hash, so no password is kept in memory and
+# changing the stored hash makes old entries unreachable
+class PasswordVerificationCache:
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._secret = secrets.token_bytes(32)
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.max_size = app.config["PASSWORD_CACHE_SIZE"]
+        self.ttl = app.config["PASSWORD_CACHE_TTL"]
+
+    def verify(self, user_id, password, password_hash):
+        key = (user_id, self._digest(user_id, password, password_hash))
+        now = monotonic()
+
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+
+        # failed verifications are never cached, every wrong guess pays the KDF
+        if not password_hasher.verify(password, password_hash):
+            return False
+
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[key] = now + self.ttl
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def _digest(self, user_id, password, password_hash):
+        message = b"\0".join(
+            [str(user_id).encode(), password.encode(), password_hash.encode()]
+        )
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+password_cache = PasswordVerificationCache()
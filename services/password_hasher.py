@@ -0,0 +1,113 @@
+import atexit
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+from passlib.hash import pbkdf2_sha256
+
+from services.metrics import metrics
+
+
+def _run_timed(func, args):
+    # runs in a pool process, reports when the job actually started
+    return time.time(), func(*args)
+
+
+def _hash(password):
+    return pbkdf2_sha256.hash(password)
+
+
+def _verify(password, password_hash):
+    return pbkdf2_sha256.verify(password, password_hash)
+
+
+# runs pbkdf2 hashing and verification in an optional process pool, so the
+# KDF does not hold the GIL of the worker serving other requests; at most
+# max_concurrency jobs per process are handed to the pool, further callers
+# wait their turn. A pool that breaks before completing a single job can not
+# start here, and hashing falls back to the calling thread for good
+class PasswordHasher:
+    def __init__(self):
+        self.workers = 0
+        self.max_concurrency = 1
+        self.jobs = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self._executor = None
+        self._started = False
+        self._logger = None
+        self._slots = BoundedSemaphore(1)
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.workers = app.config["HASHING_POOL_WORKERS"]
+        self.max_concurrency = app.config["HASHING_MAX_CONCURRENCY"]
+        self._logger = app.logger
+        self._slots = BoundedSemaphore(self.max_concurrency)
+
+    def hash(self, password):
+        with metrics.span("auth"):
+            return self._run(_hash, password)
+
+    def verify(self, password, password_hash):
+        with metrics.span("auth"):
+            return self._run(_verify, password, password_hash)
+
+    def _run(self, func, *args):
+        if self.workers == 0:
+            return func(*args)
+
+        queued_at = time.time()
+        with self._slots:
+            try:
+                started_at, result = (
+                    self._get_executor().submit(_run_timed, func, args).result()
+                )
+                self._started = True
+            except (BrokenProcessPool, OSError):
+                # a killed pool process breaks the pool, the next job starts a
+                # new one and this one runs on the calling thread
+                self._executor = None
+                if not self._started:
+                    self.workers = 0
+                    self._logger.warning(
+                        "The password hashing pool could not start, hashing "
+                        "passwords on the request threads.",
+                        exc_info=True,
+                    )
+                started_at, result = _run_timed(func, args)
+
+        queue_time = max(started_at - queued_at, 0.0)
+        with self._lock:
+            self.jobs += 1
+            self.queue_time_total += queue_time
+            self.queue_time_max = max(self.queue_time_max, queue_time)
+        return result
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                # created lazily so that forking servers get one pool per
+                # worker, spawned to be safe in a multithreaded process
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                    atexit.register(self._executor.shutdown)
+        return self._executor
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_concurrency": self.max_concurrency,
+                "jobs": self.jobs,
+                "queue_time_total": self.queue_time_total,
+                "queue_time_max": self.queue_time_max,
+            }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,241 @@
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from time import monotonic, time
+
+from flask import current_app
+from sqlalchemy import case, delete, func, select, update
+
+from db import db
+from models import CacheVersion, DataModel, DataType
+from services.partitions import (
+    archive_table,
+    drop_partitions,
+    expired_partitions,
+    list_partitions,
+    month_start,
+    next_month,
+    partition_month,
+    series_counts,
+)
+from services.rollups import prune_rollups
+from services.summaries import prune_summaries
+from services.token_blocklist import token_blocklist
+
+
+def retention_cutoffs(now=None):
+    # {data_type_id: cutoff} of the data types with a retention
+    now = now or datetime.utcnow()
+    rows = db.session.execute(
+        select(DataType.id, DataType.retention_days).where(
+            DataType.retention_days.is_not(None)
+        )
+    ).all()
+    return {id: now - timedelta(days=days) for id, days in rows}
+
+
+def drop_expired_partitions(before):
+    # drop_partitions, which also takes the dropped readings out of the
+    # rollups, in the same transaction, and out of the summaries
+    removed = {}
+    for name in expired_partitions(before):
+        month = partition_month(name)
+        for (device_id, data_type_id), count in series_counts(name).items():
+            removed[device_id] = removed.get(device_id, 0) + count
+            if current_app.config["DATA_ROLLUPS_ENABLED"]:
+                # months start on bucket boundaries, so no bucket is cut
+                prune_rollups(device_id, data_type_id, next_month(month), month)
+    dropped = drop_partitions(before)
+
+    if removed and current_app.config["DATA_SUMMARIES_ENABLED"]:
+        prune_summaries(removed)
+        db.session.commit()
+    return dropped
+
+
+def _drop_expired_partitions(cutoffs):
+    # whole months older than every retention are dropped instead of deleted
+    # row by row, which is only possible when every data type has one
+    if not cutoffs:
+        return []
+    types = db.session.execute(select(DataType.id)).scalars().all()
+    if any(id not in cutoffs for id in types):
+        return []
+    return drop_expired_partitions(month_start(min(cutoffs.values())))
+
+
+def _expired_series(table, cutoffs):
+    # (device_id, data_type_id) pairs of the table with readings older than
+    # the cutoff of their data type, in one pass over the
+    # (device_id, data_type_id, generation_time) index
+    cutoff = case(cutoffs, value=table.c.data_type_id)
+    return db.session.execute(
+        select(table.c.device_id, table.c.data_type_id)
+        .where(table.c.data_type_id.in_(cutoffs))
+        .group_by(table.c.device_id, table.c.data_type_id)
+        .having(func.min(table.c.generation_time) < cutoff)
+    ).all()
+
+
+def _prune_chunk(table, device_id, data_type_id, cutoff, chunk_size):
+    # deletes at most chunk_size readings, found through the
+    # (device_id, data_type_id, generation_time) index; the caller commits
+    expired = (
+        select(table.c.id)
+        .where(
+            table.c.device_id == device_id,
+            table.c.data_type_id == data_type_id,
+            table.c.generation_time < cutoff,
+        )
+        .order_by(table.c.generation_time)
+        .limit(chunk_size)
+    )
+    result = db.session.execute(delete(table).where(table.c.id.in_(expired)))
+    return result.rowcount
+
+
+# deletes readings older than the retention of their data type in chunks of
+# chunk_size rows, each in its own short transaction followed by a pause, so
+# ingest never waits long on the locks; the last chunk of every device and
+# data type also updates its rollups. Also purges the token blocklist.
+# The background thread starts with the first request a process serves, so
+# CLI commands and the gateway do not run it, and a lease in cache_versions
+# lets only one of the server processes prune per interval
+class RetentionJob:
+    LEASE_NAME = "retention"
+
+    def __init__(self):
+        self.interval = 3600.0
+        self.chunk_size = 1000
+        self.pause = 0.05
+        self.runs = 0
+        self.skipped = 0
+        self.pruned = 0
+        self.last_run = {}
+        self._app = None
+        self._thread = None
+        self._lock = Lock()
+        self._stopped = Event()
+
+    def init_app(self, app):
+        self.interval = app.config["DATA_RETENTION_INTERVAL"]
+        self.chunk_size = app.config["DATA_RETENTION_CHUNK_SIZE"]
+        self.pause = app.config["DATA_RETENTION_PAUSE_MS"] / 1000
+        self._app = app
+
+        if self.interval > 0:
+            app.before_request(self._start)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="retention", daemon=True)
+                self._thread.start()
+
+    def run(self, now=None):
+        # one pass over all data types, returns the report of the run
+        started = monotonic()
+        cutoffs = retention_cutoffs(now)
+        dropped = _drop_expired_partitions(cutoffs)
+
+        # PostgreSQL partitions are reached through the data table
+        tables = [DataModel.__table__]
+        if db.engine.dialect.name == "sqlite":
+            tables += [archive_table(name) for _, name in list_partitions()]
+
+        # {(device_id, data_type_id): tables holding expired readings}
+        series = {}
+        if cutoffs:
+            for table in tables:
+                for key in _expired_series(table, cutoffs):
+                    series.setdefault(tuple(key), []).append(table)
+
+        pruned = 0
+        # {device_id: readings deleted}, to take them out of the summaries
+        removed = {}
+        for (device_id, data_type_id), expired_tables in sorted(series.items()):
+            cutoff = cutoffs[data_type_id]
+            deleted = 0
+            for table in expired_tables:
+                while not self._stopped.is_set():
+                    count = _prune_chunk(
+                        table, device_id, data_type_id, cutoff, self.chunk_size
+                    )
+                    deleted += count
+                    if count < self.chunk_size:
+                        break
+                    db.session.commit()
+                    self._stopped.wait(self.pause)
+
+            # an interrupted run leaves the rollups to the next one
+            rollups = current_app.config["DATA_ROLLUPS_ENABLED"]
+            if deleted and rollups and not self._stopped.is_set():
+                prune_rollups(device_id, data_type_id, cutoff)
+            db.session.commit()
+            pruned += deleted
+            if deleted:
+                removed[device_id] = removed.get(device_id, 0) + deleted
+
+        if removed and current_app.config["DATA_SUMMARIES_ENABLED"]:
+            prune_summaries(removed)
+            db.session.commit()
+
+        tokens = token_blocklist.purge()
+
+        self.runs += 1
+        self.pruned += pruned
+        self.last_run = {
+            "pruned": pruned,
+            "dropped": len(dropped),
+            "tokens": tokens,
+            "seconds": round(monotonic() - started, 3),
+        }
+        return self.last_run
+
+    def take_lease(self):
+        # the lease row holds the minute since the Unix epoch until which the
+        # last process to start a run holds it; it ends a minute before that
+        # process wakes up again, so it is not skipping its own next run
+        now = int(time() // 60)
+        until = now + max(int(self.interval // 60) - 1, 0)
+        result = db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == self.LEASE_NAME, CacheVersion.version <= now)
+            .values(version=until)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _run(self):
+        # the first pass waits an interval, e.g. for migrations to finish
+        while not self._stopped.wait(self.interval):
+            with self._app.app_context():
+                try:
+                    if not self.take_lease():
+                        self.skipped += 1
+                        continue
+                    report = self.run()
+                    self._app.logger.info(
+                        "Retention pruned %(pruned)d readings, dropped %(dropped)d "
+                        "partitions and purged %(tokens)d tokens in %(seconds)ss.",
+                        report,
+                    )
+                except Exception:
+                    db.session.rollback()
+                    self._app.logger.exception("Retention run failed.")
+                finally:
+                    db.session.remove()
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "pruned": self.pruned,
+            "last_pruned": self.last_run.get("pruned", 0),
+            "last_seconds": self.last_run.get("seconds", 0),
+        }
+
+
+retention_job = RetentionJob()
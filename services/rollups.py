@@ -0,0 +1,175 @@
+from datetime import timedelta
+
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db import db
+from models import DataRollup
+from services.partitions import data_source
+from services.timeseries import bucket_floor, bucket_start
+
+ROLLUP_BUCKETS = ("1h", "1d")
+ROLLUP_LENGTHS = {"1h": timedelta(hours=1), "1d": timedelta(days=1)}
+
+
+def apply_rollups(rows):
+    # folds new readings into their hourly and daily buckets, the caller
+    # commits the session together with the readings themselves
+    groups = {}
+    for row in rows:
+        value = row["generated_value"]
+        for bucket in ROLLUP_BUCKETS:
+            key = (
+                row["device_id"],
+                row["data_type_id"],
+                bucket,
+                bucket_floor(row["generation_time"], bucket),
+            )
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [1, value, value, value]
+            else:
+                group[0] += 1
+                group[1] += value
+                group[2] = min(group[2], value)
+                group[3] = max(group[3], value)
+
+    if not groups:
+        return
+
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(DataRollup)
+        least, greatest = func.least, func.greatest
+    else:
+        statement = sqlite.insert(DataRollup)
+        # SQLite's multi-argument min/max are scalar functions
+        least, greatest = func.min, func.max
+
+    statement = statement.on_conflict_do_update(
+        index_elements=["device_id", "data_type_id", "bucket", "bucket_start"],
+        set_={
+            "count": DataRollup.count + statement.excluded["count"],
+            "sum": DataRollup.sum + statement.excluded["sum"],
+            "min": least(DataRollup.min, statement.excluded["min"]),
+            "max": greatest(DataRollup.max, statement.excluded["max"]),
+        },
+    )
+    db.session.execute(
+        statement,
+        [
+            {
+                "device_id": device_id,
+                "data_type_id": data_type_id,
+                "bucket": bucket,
+                "bucket_start": time,
+                "count": count,
+                "sum": total,
+                "min": minimum,
+                "max": maximum,
+            }
+            for (device_id, data_type_id, bucket, time), (
+                count,
+                total,
+                minimum,
+                maximum,
+            ) in groups.items()
+        ],
+    )
+
+
+def prune_rollups(device_id, data_type_id, end, start=None):
+    # takes the deleted readings of [start, end) of one device and data type
+    # out of its rollups: buckets inside the range are deleted, the ones it
+    # cuts are recomputed from their remaining readings; the caller commits
+    # the session together with the deletes
+    data = data_source()
+    for bucket in ROLLUP_BUCKETS:
+        length = ROLLUP_LENGTHS[bucket]
+        series = (
+            DataRollup.device_id == device_id,
+            DataRollup.data_type_id == data_type_id,
+            DataRollup.bucket == bucket,
+        )
+
+        cut = set()
+        inside = [DataRollup.bucket_start < bucket_floor(end, bucket)]
+        if bucket_floor(end, bucket) != end:
+            cut.add(bucket_floor(end, bucket))
+        if start is not None:
+            first = bucket_floor(start, bucket)
+            if first != start:
+                cut.add(first)
+                first += length
+            inside.append(DataRollup.bucket_start >= first)
+        db.session.execute(delete(DataRollup).where(*series, *inside))
+
+        for time in cut:
+            count, total, minimum, maximum = db.session.execute(
+                select(
+                    func.count(),
+                    func.sum(data.c.generated_value),
+                    func.min(data.c.generated_value),
+                    func.max(data.c.generated_value),
+                ).where(
+                    data.c.device_id == device_id,
+                    data.c.data_type_id == data_type_id,
+                    data.c.generation_time >= time,
+                    data.c.generation_time < time + length,
+                )
+            ).one()
+            if count:
+                query = update(DataRollup).values(
+                    count=count, sum=total, min=minimum, max=maximum
+                )
+            else:
+                query = delete(DataRollup)
+            db.session.execute(query.where(*series, DataRollup.bucket_start == time))
+
+
+def rebuild_rollups(device_id=None):
+    # recomputes the rollups from the raw readings, returns the number of
+    # rollup rows written
+    data = data_source()
+    dialect_name = db.session.get_bind().dialect.name
+
+    query = delete(DataRollup)
+    if device_id is not None:
+        query = query.where(DataRollup.device_id == device_id)
+    db.session.execute(query)
+
+    written = 0
+    for bucket in ROLLUP_BUCKETS:
+        time = bucket_start(data.c.generation_time, bucket, dialect_name)
+        aggregate = select(
+            data.c.device_id,
+            data.c.data_type_id,
+            literal(bucket),
+            time,
+            func.count(),
+            func.sum(data.c.generated_value),
+            func.min(data.c.generated_value),
+            func.max(data.c.generated_value),
+        ).group_by(data.c.device_id, data.c.data_type_id, time)
+        if device_id is not None:
+            aggregate = aggregate.where(data.c.device_id == device_id)
+
+        result = db.session.execute(
+            insert(DataRollup).from_select(
+                [
+                    "device_id",
+                    "data_type_id",
+                    "bucket",
+                    "bucket_start",
+                    "count",
+                    "sum",
+                    "min",
+                    "max",
+                ],
+                aggregate,
+            )
+        )
+        written += result.rowcount
+
+    db.session.commit()
+    return written
@@ -0,0 +1,281 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db import db
+from models import DataType, DeviceModel, DeviceSummary, LatestReading
+from services.partitions import data_source
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _least_greatest():
+    # the dialect's two-argument min/max
+    if _dialect() == "postgresql":
+        return func.least, func.greatest
+    # SQLite's multi-argument min/max are scalar functions
+    return func.min, func.max
+
+
+def _upsert(model):
+    # the dialect's INSERT .. ON CONFLICT and its two-argument min/max
+    dialect = postgresql if _dialect() == "postgresql" else sqlite
+    return (dialect.insert(model), *_least_greatest())
+
+
+def apply_summaries(rows):
+    # folds new readings into the latest readings and the device summaries,
+    # the caller commits the session together with the readings themselves
+    if not rows:
+        return
+
+    latest = {}
+    devices = {}
+    for row in rows:
+        time = row["generation_time"]
+        key = (row["device_id"], row["data_type_id"])
+        if key not in latest or time >= latest[key][1]:
+            latest[key] = (row["generated_value"], time)
+
+        device = devices.get(row["device_id"])
+        if device is None:
+            devices[row["device_id"]] = [1, time, time]
+        else:
+            device[0] += 1
+            device[1] = min(device[1], time)
+            device[2] = max(device[2], time)
+
+    # rows are upserted in key order, so concurrent batches lock them in the
+    # same order and can not deadlock
+    statement, _, _ = _upsert(LatestReading)
+    statement = statement.on_conflict_do_update(
+        index_elements=["device_id", "data_type_id"],
+        set_={
+            "generated_value": statement.excluded["generated_value"],
+            "generation_time": statement.excluded["generation_time"],
+        },
+        where=statement.excluded["generation_time"] >= LatestReading.generation_time,
+    )
+    db.session.execute(
+        statement,
+        [
+            {
+                "device_id": device_id,
+                "data_type_id": data_type_id,
+                "generated_value": value,
+                "generation_time": time,
+            }
+            for (device_id, data_type_id), (value, time) in sorted(latest.items())
+        ],
+    )
+
+    statement, least, greatest = _upsert(DeviceSummary)
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=["device_id"],
+        set_={
+            "reading_count": DeviceSummary.reading_count + excluded["reading_count"],
+            "first_time": least(DeviceSummary.first_time, excluded["first_time"]),
+            "last_time": greatest(DeviceSummary.last_time, excluded["last_time"]),
+            "last_seen": excluded["last_seen"],
+        },
+    )
+    now = datetime.utcnow()
+    db.session.execute(
+        statement,
+        [
+            {
+                "device_id": device_id,
+                "reading_count": count,
+                "first_time": first,
+                "last_time": last,
+                "last_seen": now,
+            }
+            for device_id, (count, first, last) in sorted(devices.items())
+        ],
+    )
+
+
+def prune_summaries(pruned):
+    # takes deleted readings out of the summaries: pruned is {device_id:
+    # number of deleted readings}, whose counts are decremented while their
+    # first, last and latest readings are read again from the remaining ones,
+    # one index lookup per data type and end; the caller commits the session
+    data = data_source()
+    data_type_ids = db.session.execute(select(DataType.id)).scalars().all()
+    _, greatest = _least_greatest()
+    for device_id, count in sorted(pruned.items()):
+        latest = []
+        first_times = []
+        for data_type_id in data_type_ids:
+            of_type = (
+                data.c.device_id == device_id,
+                data.c.data_type_id == data_type_id,
+            )
+            row = db.session.execute(
+                select(data.c.generated_value, data.c.generation_time)
+                .where(*of_type)
+                .order_by(data.c.generation_time.desc(), data.c.id.desc())
+                .limit(1)
+            ).first()
+            if row is None:
+                continue
+            latest.append(
+                {
+                    "device_id": device_id,
+                    "data_type_id": data_type_id,
+                    "generated_value": row.generated_value,
+                    "generation_time": row.generation_time,
+                }
+            )
+            first_times.append(
+                db.session.execute(
+                    select(func.min(data.c.generation_time)).where(*of_type)
+                ).scalar()
+            )
+
+        db.session.execute(
+            delete(LatestReading).where(LatestReading.device_id == device_id)
+        )
+        if latest:
+            db.session.execute(insert(LatestReading), latest)
+        db.session.execute(
+            update(DeviceSummary)
+            .where(DeviceSummary.device_id == device_id)
+            .values(
+                reading_count=greatest(DeviceSummary.reading_count - count, 0),
+                first_time=min(first_times, default=None),
+                last_time=max((row["generation_time"] for row in latest), default=None),
+            )
+        )
+
+
+def _computed(device_id=None):
+    # (summaries, latest readings) computed from the raw readings, with the
+    # columns of the device_summary and latest_reading tables; when the
+    # readings arrived is unknown, so last_seen is the last generation time
+    data = data_source()
+    ranked = select(
+        data.c.device_id,
+        data.c.data_type_id,
+        data.c.generated_value,
+        data.c.generation_time,
+        func.row_number()
+        .over(
+            partition_by=(data.c.device_id, data.c.data_type_id),
+            order_by=(data.c.generation_time.desc(), data.c.id.desc()),
+        )
+        .label("rank"),
+    )
+    summary = select(
+        data.c.device_id,
+        func.count().label("reading_count"),
+        func.min(data.c.generation_time).label("first_time"),
+        func.max(data.c.generation_time).label("last_time"),
+        func.max(data.c.generation_time).label("last_seen"),
+    ).group_by(data.c.device_id)
+    if device_id is not None:
+        ranked = ranked.where(data.c.device_id == device_id)
+        summary = summary.where(data.c.device_id == device_id)
+
+    ranked = ranked.subquery()
+    latest = select(
+        ranked.c.device_id,
+        ranked.c.data_type_id,
+        ranked.c.generated_value,
+        ranked.c.generation_time,
+    ).where(ranked.c.rank == 1)
+    return summary, latest
+
+
+def rebuild_summaries(device_id=None):
+    # recomputes the latest readings and device summaries from the raw
+    # readings, returns the number of summarized devices
+    for model in (LatestReading, DeviceSummary):
+        query = delete(model)
+        if device_id is not None:
+            query = query.where(model.device_id == device_id)
+        db.session.execute(query)
+
+    summary, latest = _computed(device_id)
+    db.session.execute(
+        insert(LatestReading).from_select(
+            ["device_id", "data_type_id", "generated_value", "generation_time"],
+            latest,
+        )
+    )
+    result = db.session.execute(
+        insert(DeviceSummary).from_select(
+            ["device_id", "reading_count", "first_time", "last_time", "last_seen"],
+            summary,
+        )
+    )
+
+    db.session.commit()
+    return result.rowcount
+
+
+def device_summaries(device_id=None):
+    # summaries of all devices, or of one, with their latest readings; reads
+    # one row per device and one per device and data type, which are computed
+    # from the raw readings when the summaries are not maintained at ingest
+    if current_app.config["DATA_SUMMARIES_ENABLED"]:
+        summary, latest = DeviceSummary.__table__, LatestReading.__table__
+    else:
+        summary, latest = (query.subquery() for query in _computed(device_id))
+
+    summaries = {}
+    query = (
+        select(
+            DeviceModel.id,
+            summary.c.reading_count,
+            summary.c.first_time,
+            summary.c.last_time,
+            summary.c.last_seen,
+        )
+        .outerjoin(summary, summary.c.device_id == DeviceModel.id)
+        .order_by(DeviceModel.id)
+    )
+    if device_id is not None:
+        query = query.where(DeviceModel.id == device_id)
+    for id, count, first_time, last_time, last_seen in db.session.execute(query):
+        summaries[id] = {
+            "device_id": id,
+            "reading_count": count or 0,
+            "first_time": first_time,
+            "last_time": last_time,
+            "last_seen": last_seen,
+            "latest": [],
+        }
+
+    query = (
+        select(
+            latest.c.device_id,
+            latest.c.data_type_id,
+            DataType.name,
+            DataType.unit,
+            latest.c.generated_value,
+            latest.c.generation_time,
+        )
+        .join(DataType, DataType.id == latest.c.data_type_id)
+        .order_by(latest.c.device_id, latest.c.data_type_id)
+    )
+    if device_id is not None:
+        query = query.where(latest.c.device_id == device_id)
+    for id, data_type_id, name, unit, value, time in db.session.execute(query):
+        if id in summaries:
+            summaries[id]["latest"].append(
+                {
+                    "data_type_id": data_type_id,
+                    "name": name,
+                    "unit": unit,
+                    "value": value,
+                    "time": time,
+                }
+            )
+
+    return list(summaries.values())
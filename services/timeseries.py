@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+# bucket -> (PostgreSQL date_trunc field, SQLite strftime format); the SQLite
+# format matches how SQLAlchemy stores datetimes, so truncated values compare
+# equal to bucket starts written from Python
+BUCKETS = {
+    "1m": ("minute", "%Y-%m-%d %H:%M:00.000000"),
+    "1h": ("hour", "%Y-%m-%d %H:00:00.000000"),
+    "1d": ("day", "%Y-%m-%d 00:00:00.000000"),
+}
+
+
+def bucket_start(column, bucket, dialect_name):
+    # SQL expression truncating a timestamp column to the start of its bucket
+    field, format = BUCKETS[bucket]
+    if dialect_name == "sqlite":
+        return func.strftime(format, column)
+    return func.date_trunc(field, column)
+
+
+def bucket_time(value):
+    # SQLite returns the truncated timestamp as text
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def bucket_floor(time, bucket):
+    # Python counterpart of bucket_start
+    time = time.replace(second=0, microsecond=0)
+    if bucket in ("1h", "1d"):
+        time = time.replace(minute=0)
+    if bucket == "1d":
+        time = time.replace(hour=0)
+    return time
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import monotonic
+
+from sqlalchemy import and_, delete, event, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from db import db
+from models import TokenBlocklist
+from services.metrics import metrics
+
+
+# in-process index of revoked jtis; loaded when the app starts, later
+# refreshes only read rows revoked after the last seen revoked_at, so
+# checking a token that is not revoked never waits on the database
+class TokenBlocklistIndex:
+    # rows committed late by another process can carry a revoked_at older
+    # than the watermark, so every refresh re-reads this much history
+    WATERMARK_OVERLAP = timedelta(seconds=60)
+    # session.info key of the jtis to index once the session commits
+    PENDING_KEY = "token_blocklist_revoked"
+
+    def __init__(
+        self,
+        refresh_interval=5.0,
+        reload_interval=3600.0,
+        max_token_age=timedelta(days=365),
+    ):
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.max_token_age = max_token_age
+        self.lookups = 0
+        self.refreshes = 0
+        self.purged = 0
+        self._jtis = set()
+        self._loaded = False
+        self._watermark = None
+        self._next_refresh = 0.0
+        self._next_reload = 0.0
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config["TOKEN_BLOCKLIST_REFRESH_INTERVAL"]
+        self.reload_interval = app.config["TOKEN_BLOCKLIST_RELOAD_INTERVAL"]
+        self.max_token_age = app.config["JWT_ACCESS_TOKEN_EXPIRES"]
+        if not event.contains(Session, "after_commit", self._after_commit):
+            event.listen(Session, "after_commit", self._after_commit)
+            event.listen(Session, "after_rollback", self._after_rollback)
+
+        # create_app also runs for flask db upgrade, before the table exists;
+        # the index is then loaded by the first lookup
+        with app.app_context():
+            try:
+                if inspect(db.engine).has_table(TokenBlocklist.__tablename__):
+                    self.refresh(force=True)
+            except SQLAlchemyError:
+                app.logger.warning("Could not load the token blocklist.", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def is_revoked(self, jti):
+        self.lookups += 1
+        with metrics.span("auth"):
+            self.refresh()
+            return jti in self._jtis
+
+    def revoke(self, jwt_payload):
+        # adds the token to the blocklist, the caller commits the session;
+        # another process may have revoked the same token since the last
+        # refresh, so an existing row is left alone instead of failing on the
+        # unique jti, and the index only learns the jti once it is committed
+        jti = jwt_payload["jti"]
+        expires_at = None
+        if jwt_payload.get("exp") is not None:
+            expires_at = datetime.fromtimestamp(jwt_payload["exp"], timezone.utc)
+
+        dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+        db.session.execute(
+            dialect.insert(TokenBlocklist)
+            .values(
+                jti=jti, revoked_at=datetime.now(timezone.utc), expires_at=expires_at
+            )
+            .on_conflict_do_nothing(index_elements=["jti"])
+        )
+        db.session.info.setdefault(self.PENDING_KEY, set()).add(jti)
+
+    def _after_commit(self, session):
+        jtis = session.info.pop(self.PENDING_KEY, None)
+        if jtis:
+            self._jtis.update(jtis)
+
+    def _after_rollback(self, session):
+        session.info.pop(self.PENDING_KEY, None)
+
+    def refresh(self, force=False):
+        now = monotonic()
+        if not force and now < self._next_refresh:
+            return
+
+        # one thread refreshes while the others keep using the current index,
+        # except before it is loaded, when an empty index would accept
+        # revoked tokens
+        if not self._lock.acquire(blocking=force or not self._loaded):
+            return
+        try:
+            if not force and monotonic() < self._next_refresh:
+                return  # refreshed by the thread we waited for
+
+            # an occasional full reload drops the tokens purged since
+            reload = not self._loaded or now >= self._next_reload
+            query = select(TokenBlocklist.jti, TokenBlocklist.revoked_at)
+            if not reload and self._watermark is not None:
+                since = self._watermark - self.WATERMARK_OVERLAP
+                query = query.where(TokenBlocklist.revoked_at >= since)
+
+            rows = db.session.execute(query).all()
+            revoked = [revoked_at for _, revoked_at in rows]
+            if reload:
+                self._jtis = {jti for jti, _ in rows}
+                self._next_reload = now + self.reload_interval
+            else:
+                self._jtis.update(jti for jti, _ in rows)
+                if self._watermark is not None:
+                    revoked.append(self._watermark)
+            self._watermark = max(revoked, default=None)
+
+            self._loaded = True
+            self.refreshes += 1
+            self._next_refresh = now + self.refresh_interval
+        finally:
+            self._lock.release()
+
+    def purge(self):
+        # rows of expired tokens are useless, an expired token is rejected
+        # before the blocklist is consulted; run by the retention job, every
+        # process drops them from its index with its next full reload
+        now = datetime.now(timezone.utc)
+        result = db.session.execute(
+            delete(TokenBlocklist).where(
+                or_(
+                    TokenBlocklist.expires_at < now,
+                    and_(
+                        TokenBlocklist.expires_at.is_(None),
+                        TokenBlocklist.revoked_at < now - self.max_token_age,
+                    ),
+                )
+            )
+        )
+        db.session.commit()
+        self.purged += result.rowcount
+
+        self._next_reload = 0.0
+        return result.rowcount
+
+    def stats(self):
+        return {
+            "size": len(self._jtis),
+            "lookups": self.lookups,
+            "refreshes": self.refreshes,
+            "purged": self.purged,
+        }
+
+
+token_blocklist = TokenBlocklistIndex()
@@ -0,0 +1,68 @@
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import create_benchmark_app, seed_devices
+
+
+def write_csv(path, rows, devices):
+    # readings of one data type per device, a second apart
+    start = datetime(2020, 1, 1)
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(["time", "device_id", "name", "unit", "value"])
+        for index in range(rows):
+            writer.writerow(
+                (
+                    (start + timedelta(seconds=index)).isoformat(),
+                    devices[index % len(devices)],
+                    "Temperature",
+                    "Celsius",
+                    round(random.random() * 100, 3),
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import benchmark.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--drop-indexes", action="store_true")
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    with app.app_context():
+        devices = seed_devices(args.devices)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="iot-import-"), "readings.csv")
+    started = time.perf_counter()
+    write_csv(path, args.rows, devices)
+    print(
+        f"file written:     {os.path.getsize(path) / 2**20:.0f} MB "
+        f"in {time.perf_counter() - started:.1f} s"
+    )
+
+    command = ["data", "import", path, "--chunk-size", str(args.chunk_size)]
+    if args.drop_indexes:
+        command.append("--drop-indexes")
+
+    started = time.perf_counter()
+    result = app.test_cli_runner().invoke(args=command)
+    elapsed = time.perf_counter() - started
+    if result.exit_code:
+        raise SystemExit(result.output)
+
+    print(result.output.strip())
+    print(f"rows imported:    {args.rows}")
+    print(f"elapsed:          {elapsed:.1f} s")
+    print(f"rows/sec:         {args.rows / elapsed:,.0f}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import random
+import resource
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# the benchmarks are run as scripts, make the application importable
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+from passlib.hash import pbkdf2_sha256  # noqa: E402
+
+from app import create_app  # noqa: E402
+from db import db  # noqa: E402
+from models import AdminModel, DataModel, DeviceModel, DeviceStatus  # noqa: E402
+
+
+def create_benchmark_app(database_url=None, **config):
+    # a throwaway SQLite database unless DATABASE_URL points somewhere else
+    if database_url is None:
+        database_url = os.getenv("BENCHMARK_DATABASE_URL")
+    if database_url is None:
+        directory = tempfile.mkdtemp(prefix="iot-benchmark-")
+        database_url = "sqlite:///" + os.path.join(directory, "benchmark.db")
+
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_KEY", "benchmark-" + "0" * 32)
+    for key, value in config.items():
+        os.environ[key] = str(value)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed_devices(count, password="password", status=DeviceStatus.APPROVED):
+    # the same hash for every device keeps seeding fast
+    password_hash = pbkdf2_sha256.hash(password)
+    devices = [
+        DeviceModel(
+            username=f"device-{index}",
+            password=password_hash,
+            serial_number=f"SN-{index:08d}",
+            status=status,
+        )
+        for index in range(count)
+    ]
+    db.session.add_all(devices)
+    db.session.commit()
+    return [device.id for device in devices]
+
+
+def seed_admin(username="admin", password="password"):
+    admin = AdminModel(
+        username=username, password=pbkdf2_sha256.hash(password), role="admin"
+    )
+    db.session.add(admin)
+    db.session.commit()
+    return admin.id
+
+
+def seed_readings(device_id, data_type_id, count, chunk_size=50000):
+    start = datetime(2024, 1, 1)
+    data = DataModel.__table__
+    for offset in range(0, count, chunk_size):
+        db.session.execute(
+            data.insert(),
+            [
+                {
+                    "device_id": device_id,
+                    "data_type_id": data_type_id,
+                    "generated_value": random.random() * 100,
+                    "generation_time": start + timedelta(seconds=index),
+                }
+                for index in range(offset, min(offset + chunk_size, count))
+            ],
+        )
+        db.session.commit()
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,52 @@
+import argparse
+import time
+
+from common import create_benchmark_app, peak_rss_mb, seed_devices, seed_readings
+
+from flask_jwt_extended import create_access_token
+
+from db import db
+from services import data_type_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming export benchmark.")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    with app.app_context():
+        (device_id,) = seed_devices(1)
+        data_type_id = data_type_cache.resolve("Temperature", "Celsius")
+        seed_readings(device_id, data_type_id, args.rows)
+        token = create_access_token(identity=device_id)
+        db.session.remove()
+
+    rss_before = peak_rss_mb()
+    client = app.test_client()
+
+    started = time.perf_counter()
+    response = client.get(
+        f"/devices/{device_id}/data/export?format={args.format}",
+        headers={"Authorization": f"Bearer {token}"},
+        buffered=False,
+    )
+    lines = 0
+    size = 0
+    for chunk in response.response:
+        lines += chunk.count(b"\n") if isinstance(chunk, bytes) else chunk.count("\n")
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    exported = lines - (1 if args.format == "csv" else 0)
+    print(f"rows exported:    {exported}")
+    print(f"bytes exported:   {size}")
+    print(f"elapsed:          {elapsed:.2f} s")
+    print(f"rows/sec:         {exported / elapsed:,.0f}")
+    print(f"peak RSS before:  {rss_before:.1f} MB")
+    print(f"peak RSS after:   {peak_rss_mb():.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from common import ROOT_DIR, create_benchmark_app, seed_devices
+
+from flask_jwt_extended import create_access_token
+
+from db import db
+from services import data_type_cache
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def connect(port, token, semaphore):
+    async with semaphore:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"AUTH " + token.encode() + b"\n")
+        reply = await reader.readline()
+        if not reply.startswith(b"OK"):
+            raise RuntimeError(reply.decode())
+        return reader, writer
+
+
+async def send(reader, writer, data_type_id, readings):
+    writer.write(f"{data_type_id} 21.5\n".encode() * readings + b"FLUSH\n")
+    await writer.drain()
+    reply = await reader.readline()
+    if reply != b"OK\n":
+        raise RuntimeError(reply.decode())
+
+
+async def run(args, port, tokens, data_type_id, pid):
+    await wait_for_port(port)
+    rss_before = rss_mb(pid)
+
+    # opening handshakes are limited so the listen backlog does not overflow
+    semaphore = asyncio.Semaphore(512)
+    started = time.perf_counter()
+    connections = await asyncio.gather(
+        *(connect(port, token, semaphore) for token in tokens)
+    )
+    connect_elapsed = time.perf_counter() - started
+    await asyncio.sleep(1)
+    rss_idle = rss_mb(pid)
+
+    senders = connections[: args.senders]
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            send(reader, writer, data_type_id, args.readings)
+            for reader, writer in senders
+        )
+    )
+    send_elapsed = time.perf_counter() - started
+
+    for _, writer in connections:
+        writer.close()
+
+    total = args.senders * args.readings
+    print(f"connections:          {len(connections)}")
+    print(f"connect + AUTH:       {connect_elapsed:.1f} s")
+    print(f"gateway RSS before:   {rss_before:.1f} MB")
+    print(
+        f"gateway RSS idle:     {rss_idle:.1f} MB "
+        f"({(rss_idle - rss_before) * 1024 / len(connections):.1f} KB/connection)"
+    )
+    print(f"readings stored:      {total} from {args.senders} connections")
+    print(f"readings/sec:         {total / send_elapsed:,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP ingest gateway benchmark.")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--senders", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=1000)
+    args = parser.parse_args()
+
+    # a file descriptor per connection on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    app = create_benchmark_app(INGEST_FLUSH_ROWS=5000)
+    with app.app_context():
+        device_ids = seed_devices(args.connections)
+        data_type_id = data_type_cache.resolve("Temperature", "Celsius")
+        tokens = [create_access_token(identity=id) for id in device_ids]
+        db.session.remove()
+
+    port = free_port()
+    gateway = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "flask",
+            "--app",
+            "app",
+            "gateway",
+            "run",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+        ],
+        cwd=ROOT_DIR,
+        env=os.environ,
+    )
+    try:
+        asyncio.run(run(args, port, tokens, data_type_id, gateway.pid))
+    finally:
+        gateway.terminate()
+        gateway.wait()
+
+
+if __name__ == "__main__":
+    main()
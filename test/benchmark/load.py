@@ -0,0 +1,236 @@
+import argparse
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from waitress.server import create_server
+
+from common import create_benchmark_app, seed_admin, seed_devices
+
+from db import db
+
+SCENARIOS = ("login", "data", "batch", "status", "devices")
+
+
+def percentile(latencies, fraction):
+    # nearest-rank percentile of sorted latencies
+    if not latencies:
+        return 0.0
+    index = max(math.ceil(fraction * len(latencies)) - 1, 0)
+    return latencies[index]
+
+
+def start_server(app, threads):
+    # the server thread is a daemon and stops with the benchmark process
+    server = create_server(app, host="127.0.0.1", port=0, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.effective_port}"
+
+
+def run_scenario(name, calls, concurrency, readings_per_call=1):
+    # every call returns the response status, non-2xx responses are errors
+    local = threading.local()
+
+    def timed(call):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        status = call(local.session)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed, calls))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(not 200 <= status < 300 for _, status in results)
+    return {
+        "scenario": name,
+        "requests": len(results),
+        "errors": errors,
+        "rps": len(results) / elapsed,
+        "readings_per_s": len(results) * readings_per_call / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def login(base_url, device_id, index):
+    def call(session):
+        response = session.get(
+            f"{base_url}/auth/login/{device_id}",
+            headers={"username": f"device-{index}", "password": "password"},
+        )
+        return response.status_code
+
+    return call
+
+
+def post_data(base_url, token, sequence):
+    body = {
+        "name": "temperature",
+        "unit": "C",
+        "value": 20 + sequence % 10,
+        "time": datetime.now(timezone.utc).isoformat(),
+    }
+
+    def call(session):
+        response = session.post(
+            f"{base_url}/data",
+            json=body,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        return response.status_code
+
+    return call
+
+
+def post_batch(base_url, token, sequence, size):
+    now = datetime.now(timezone.utc)
+    body = [
+        {
+            "name": "temperature",
+            "unit": "C",
+            "value": 20 + (sequence + index) % 10,
+            "time": (now + timedelta(milliseconds=index)).isoformat(),
+        }
+        for index in range(size)
+    ]
+
+    def call(session):
+        response = session.post(
+            f"{base_url}/data/batch",
+            json=body,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        return response.status_code
+
+    return call
+
+
+def get(base_url, path, token):
+    def call(session):
+        response = session.get(
+            f"{base_url}{path}", headers={"Authorization": f"Bearer {token}"}
+        )
+        return response.status_code
+
+    return call
+
+
+def fetch_tokens(base_url, device_ids):
+    tokens = {}
+    with requests.Session() as session:
+        for index, device_id in enumerate(device_ids):
+            response = session.get(
+                f"{base_url}/auth/login/{device_id}",
+                headers={"username": f"device-{index}", "password": "password"},
+            )
+            response.raise_for_status()
+            tokens[device_id] = response.json()["access_token"]
+
+        response = session.get(
+            f"{base_url}/user/login",
+            headers={"username": "admin", "password": "password"},
+        )
+        response.raise_for_status()
+        admin_token = response.json()["access_token"]
+    return tokens, admin_token
+
+
+def parse_config(values):
+    config = {}
+    for value in values:
+        key, _, setting = value.partition("=")
+        config[key] = setting
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent API load benchmark.")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--server-threads", type=int, default=16)
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="readings per batch request"
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIOS,
+        help="scenario to run, may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="application setting, e.g. --set INGEST_MODE=write_behind",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    app = create_benchmark_app(**parse_config(args.set))
+    with app.app_context():
+        device_ids = seed_devices(args.devices)
+        seed_admin()
+        db.session.remove()
+
+    _, base_url = start_server(app, args.server_threads)
+    tokens, admin_token = fetch_tokens(base_url, device_ids)
+    count = args.requests
+    devices = [device_ids[i % len(device_ids)] for i in range(count)]
+    calls = {
+        "login": [
+            login(base_url, device_id, device_id - device_ids[0])
+            for device_id in devices
+        ],
+        "data": [
+            post_data(base_url, tokens[device_id], sequence)
+            for sequence, device_id in enumerate(devices)
+        ],
+        "batch": [
+            post_batch(base_url, tokens[device_id], sequence, args.batch_size)
+            for sequence, device_id in enumerate(devices)
+        ],
+        "status": [
+            get(base_url, "/auth/status", tokens[device_id]) for device_id in devices
+        ],
+        "devices": [get(base_url, "/devices/all", admin_token)] * count,
+    }
+
+    readings_per_call = {"data": 1, "batch": args.batch_size}
+    results = [
+        run_scenario(
+            name, calls[name], args.concurrency, readings_per_call.get(name, 0)
+        )
+        for name in args.scenario or SCENARIOS
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"devices: {args.devices}, concurrency: {args.concurrency}")
+    print(
+        f"{'scenario':<10} {'requests':>9} {'errors':>7} {'req/s':>9}"
+        f" {'readings/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for result in results:
+        print(
+            f"{result['scenario']:<10} {result['requests']:>9} {result['errors']:>7}"
+            f" {result['rps']:>9,.0f} {result['readings_per_s']:>11,.0f}"
+            f" {result['p50_ms']:>8.1f}"
+            f" {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_benchmark_app, seed_devices
+
+from db import db
+from services import password_cache
+
+
+def run_storm(client, device_ids, threads):
+    def login(device_id):
+        response = client.get(
+            f"/auth/login/{device_id}",
+            headers={
+                "username": f"device-{device_id - device_ids[0]}",
+                "password": "password",
+            },
+        )
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        statuses = list(executor.map(login, device_ids))
+    elapsed = time.perf_counter() - started
+
+    failed = sum(status != 200 for status in statuses)
+    return len(device_ids) / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Device reconnect storm benchmark.")
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    app = create_benchmark_app()
+    with app.app_context():
+        device_ids = seed_devices(args.devices)
+        db.session.remove()
+    client = app.test_client()
+
+    # the first storm verifies every password with the KDF, the second one is
+    # the same devices reconnecting again within the cache TTL
+    cold, cold_failed = run_storm(client, device_ids, args.threads)
+    warm, warm_failed = run_storm(client, device_ids, args.threads)
+
+    print(f"devices:               {args.devices}")
+    print(f"threads:               {args.threads}")
+    print(f"cold logins/sec:       {cold:,.0f} ({cold_failed} failed)")
+    print(f"cached logins/sec:     {warm:,.0f} ({warm_failed} failed)")
+    print(f"speedup:               {warm / cold:.1f}x")
+    print(f"cache:                 {password_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import common  # noqa: F401
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import json_provider_class
+from models import DeviceStatus
+from schemas import DataPageSchema, DeviceSchema
+from serializers import CompiledSchema
+
+
+def make_devices(count):
+    statuses = list(DeviceStatus)
+    return [
+        SimpleNamespace(
+            id=index,
+            serial_number=f"SN-{index:08d}",
+            username=f"device-{index}",
+            password="hash",
+            status=statuses[index % len(statuses)],
+        )
+        for index in range(count)
+    ]
+
+
+def make_page(count):
+    start = datetime(2024, 1, 1)
+    return {
+        "data_type_id": 1,
+        "data": [
+            {
+                "id": index,
+                "value": random.random() * 100,
+                "time": start + timedelta(seconds=index),
+            }
+            for index in range(count)
+        ],
+        "next_cursor": "MjAyNC0wMS0wMVQwMDowMDowMHwx",
+    }
+
+
+def measure(serialize, provider, obj, repeat):
+    # best of repeat runs of dump + JSON encoding of the response body
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = provider.response(serialize(obj)).get_data()
+        best = min(best, time.perf_counter() - started)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization benchmark.")
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--readings", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = json_provider_class("auto")(app)
+
+    cases = [
+        (
+            f"DeviceSchema x {args.devices}",
+            DeviceSchema(many=True),
+            CompiledSchema(DeviceSchema, many=True),
+            make_devices(args.devices),
+        ),
+        (
+            f"DataPageSchema x {args.readings}",
+            DataPageSchema(),
+            CompiledSchema(DataPageSchema),
+            make_page(args.readings),
+        ),
+    ]
+
+    print(f"fast JSON provider: {type(fast).__name__}")
+    for name, schema, compiled, obj in cases:
+        assert schema.dump(obj) == compiled.dump(obj), "dumps differ"
+        slow_time, slow_body = measure(schema.dump, stdlib, obj, args.repeat)
+        fast_time, fast_body = measure(compiled.dump, fast, obj, args.repeat)
+
+        print(name)
+        print(f"  marshmallow + json:     {slow_time * 1000:8.2f} ms")
+        print(f"  compiled + provider:    {fast_time * 1000:8.2f} ms")
+        print(f"  speedup:                {slow_time / fast_time:8.1f}x")
+        print(f"  identical bodies:       {slow_body == fast_body}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import json
+import math
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, request
+from flask_smorest import abort
+
+# the messages of marshmallow and webargs, so that both paths answer alike
+MISSING = "Missing data for required field."
+NULL = "Field may not be null."
+UNKNOWN = "Unknown field."
+INVALID_INPUT = "Invalid input type."
+INVALID_NUMBER = "Not a valid number."
+SPECIAL_NUMBER = "Special numeric values (nan or infinity) are not permitted."
+NUMBER_TOO_LARGE = "Number too large."
+INVALID_STRING = "Not a valid string."
+INVALID_DATETIME = "Not a valid datetime."
+INVALID_JSON = "Invalid JSON body."
+
+READING_FIELDS = frozenset(("value", "unit", "name", "time"))
+
+
+def validate_reading(payload):
+    # hand-written DataSchema().load(payload), returns (reading, errors)
+    if type(payload) is not dict:
+        return None, {"_schema": [INVALID_INPUT]}
+
+    errors = {}
+    if not READING_FIELDS.issuperset(payload):
+        for key in payload:
+            if key not in READING_FIELDS:
+                errors[key] = [UNKNOWN]
+
+    reading = {}
+    value = payload.get("value")
+    if value is None:
+        errors["value"] = [NULL if "value" in payload else MISSING]
+    elif value is True or value is False:
+        errors["value"] = [INVALID_NUMBER]
+    else:
+        try:
+            number = float(value)
+            if math.isfinite(number):
+                reading["value"] = number
+            else:
+                errors["value"] = [SPECIAL_NUMBER]
+        except (TypeError, ValueError):
+            errors["value"] = [INVALID_NUMBER]
+        except OverflowError:
+            errors["value"] = [NUMBER_TOO_LARGE]
+
+    for key in ("unit", "name"):
+        text = payload.get(key)
+        if type(text) is str:
+            reading[key] = text
+        elif text is None:
+            errors[key] = [NULL if key in payload else MISSING]
+        else:
+            errors[key] = [INVALID_STRING]
+
+    if "time" in payload:
+        time = payload["time"]
+        if time is None:
+            errors["time"] = [NULL]
+        elif type(time) is str:
+            try:
+                reading["time"] = datetime.fromisoformat(time)
+            except ValueError:
+                errors["time"] = [INVALID_DATETIME]
+        else:
+            errors["time"] = [INVALID_DATETIME]
+
+    if errors:
+        return None, errors
+    return reading, None
+
+
+def validate_readings(payload):
+    # hand-written DataSchema(many=True).load(payload)
+    if type(payload) is not list:
+        return None, {"_schema": [INVALID_INPUT]}
+
+    readings = []
+    errors = {}
+    for index, item in enumerate(payload):
+        reading, item_errors = validate_reading(item)
+        if item_errors:
+            errors[index] = item_errors
+        else:
+            readings.append(reading)
+
+    if errors:
+        return None, errors
+    return readings, None
+
+
+def lean_arguments(blp, schema, validator):
+    # blp.arguments(schema) for the JSON body, except that with
+    # DATA_LEAN_VALIDATION enabled the body is checked by validator instead of
+    # webargs and marshmallow; the OpenAPI docs still come from schema
+    def decorator(func):
+        documented = blp.arguments(schema)(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not current_app.config["DATA_LEAN_VALIDATION"]:
+                return documented(*args, **kwargs)
+
+            # like webargs, a body that is not JSON is an empty object
+            payload = {}
+            if request.is_json and request.get_data(cache=True):
+                # parsed by the app's JSON provider and cached on the request
+                payload = request.get_json(silent=True)
+                if payload is None:
+                    # webargs parses with the json module, which also accepts
+                    # NaN and integers beyond 64 bits
+                    try:
+                        payload = json.loads(request.get_data(cache=True))
+                    except ValueError:
+                        abort(400, messages={"json": [INVALID_JSON]})
+
+            data, errors = validator(payload)
+            if errors:
+                abort(422, messages={"json": errors})
+            return func(*args, data, **kwargs)
+
+        wrapper._apidoc = documented._apidoc
+        return wrapper
+
+    return decorator